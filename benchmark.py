@@ -0,0 +1,279 @@
+"""
+Headless load test for the Wild Values app.
+
+Drives wild_values_proto_v8.py through Streamlit's AppTest the way a user
+would: open the intro, start the test, move every one of the 35 sliders, then
+visit the type, scores and details pages. Every rerun is timed and attributed
+to the section it rendered, along with the bytes of figure JSON it produced
+and (optionally) its peak traced memory.
+
+Each scenario runs against a synthetic reference file of the given size,
+resampled from scores.csv, with the requested number of concurrent sessions:
+
+    python benchmark.py                              # 10k, 100k and 1M rows, 1 session
+    python benchmark.py --rows 100000 --sessions 8 --radar-mode density --test-mode live
+    python benchmark.py -o bench.json                # save results
+    python benchmark.py --baseline bench.json        # fail if p95 latency regressed
+    python benchmark.py --cold-start                 # time to first paint of a fresh process
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wild_values_proto_v8.py')
+SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scores.csv')
+SECTIONS = ('intro', 'test', 'type', 'scores', 'details')
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000)
+
+
+def make_synthetic_reference(n_rows, path, seed=0, binary=False):
+    """Write a reference CSV of `n_rows` resampled from scores.csv (and its binary copy)."""
+    source = pd.read_csv(SOURCE_PATH)
+    rng = np.random.default_rng(seed)
+    source.iloc[rng.integers(0, len(source), n_rows)].to_csv(path, index=False)
+    if binary:
+        from binary_scores import write_binary
+        write_binary(path)
+    return path
+
+
+class SessionRecorder:
+    """Collects per-rerun measurements, shared by all simulated sessions."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.payloads = defaultdict(list)
+        self.peak_memory = defaultdict(int)
+        self.errors = []
+
+    def rerun(self, at, action):
+        """Run one interaction and record it under the section that was rendered."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        action()
+        at.run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+
+        section = at.session_state.current_section
+        payload = sum(len(chart.proto.spec) + len(chart.proto.config) for chart in at.get('plotly_chart'))
+        with self._lock:
+            self.latencies[section].append(elapsed)
+            self.payloads[section].append(payload)
+            self.peak_memory[section] = max(self.peak_memory[section], peak)
+            if at.exception:
+                self.errors.append((section, at.exception[0].message))
+
+
+def simulate_user(recorder, radar_mode=None, test_mode=None, seed=0, timeout=600):
+    """One user clicking through the whole app."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    if radar_mode:
+        at.query_params['radar_mode'] = radar_mode
+    if test_mode:
+        at.query_params['test_mode'] = test_mode
+
+    recorder.rerun(at, lambda: None)
+    recorder.rerun(at, lambda: at.button[0].click())
+    while at.session_state.current_section == 'test' and not at.exception:
+        for i in range(len(at.select_slider)):
+            value = int(rng.integers(0, 5))
+            # Look the slider up again each time: every rerun replaces the element tree
+            if at.select_slider[i].proto.form_id:
+                # Inside a form the browser keeps the value until the form is submitted
+                at.select_slider[i].set_value(value)
+            else:
+                recorder.rerun(at, lambda: at.select_slider[i].set_value(value))
+        # Submit the form (or page) with the last button on the page
+        recorder.rerun(at, lambda: at.button[-1].click())
+    # The results pages are reached by the last button on each page
+    for _ in ('scores', 'details'):
+        recorder.rerun(at, lambda: at.button[-1].click())
+
+
+# Run in a fresh interpreter: import Streamlit, render the intro page once, then rerun it
+_COLD_START = """
+import sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+print(first, time.perf_counter() - start)
+"""
+
+
+def measure_cold_start(repeats=5):
+    """
+    Time to first paint of the intro page in a new server process (from importing
+    Streamlit to the first finished run), and of one warm rerun after it. Medians, in ms.
+    """
+    first, warm = [], []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', _COLD_START, APP_PATH], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(APP_PATH)).stdout.split()
+        first.append(1000 * float(output[-2]))
+        warm.append(1000 * float(output[-1]))
+    return {'first_paint_ms': statistics.median(first), 'warm_rerun_ms': statistics.median(warm)}
+
+
+def _reset_app_state():
+    """
+    Forget the app's process-wide cohort registry and submission store, which
+    read their environment variables only once, so the next scenario's settings apply.
+    """
+    import cohorts
+    import submissions
+
+    with cohorts._registry_lock:
+        cohorts._registry = None
+    with submissions._store_lock:
+        if submissions._store is not None:
+            submissions._store.close()
+        submissions._store = None
+        submissions._store_failed = False
+        submissions._submit_errors = 0
+
+
+def run_scenario(n_rows, sessions, radar_mode=None, test_mode=None, trace_memory=False, binary=False,
+                 workdir=None):
+    """Load-test the app against a synthetic reference file. Returns a result dict."""
+    path = os.path.join(workdir, f'scores_{n_rows}.csv')
+    if not os.path.exists(path):
+        make_synthetic_reference(n_rows, path, binary=binary)
+    os.environ['WILD_VALUES_SCORES'] = path
+    os.environ['WILD_VALUES_SUBMISSIONS_DB'] = os.path.join(workdir, 'submissions.db')
+    _reset_app_state()
+
+    recorder = SessionRecorder(trace_memory)
+    threads = [threading.Thread(target=simulate_user, args=(recorder, radar_mode, test_mode, seed))
+               for seed in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    result = {'rows': n_rows, 'sessions': sessions, 'radar_mode': radar_mode, 'test_mode': test_mode,
+              'wall_seconds': wall, 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+              'errors': recorder.errors, 'sections': {}}
+    for section in SECTIONS:
+        latencies = sorted(recorder.latencies[section])
+        if not latencies:
+            continue
+        result['sections'][section] = {
+            'reruns': len(latencies),
+            'mean_ms': 1000 * statistics.fmean(latencies),
+            'p50_ms': 1000 * latencies[len(latencies) // 2],
+            'p95_ms': 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'max_ms': 1000 * latencies[-1],
+            'payload_bytes': max(recorder.payloads[section]),
+            'peak_traced_mb': recorder.peak_memory[section] / 2 ** 20,
+        }
+    return result
+
+
+def print_result(result):
+    print(f"\n{result['rows']:,} rows, {result['sessions']} session(s), radar mode "
+          f"{result['radar_mode'] or 'default'}, test mode {result['test_mode'] or 'default'}: "
+          f"{result['wall_seconds']:.1f} s wall, max RSS {result['max_rss_mb']:.0f} MB")
+    print(f"  {'section':<8} {'reruns':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} "
+          f"{'payload B':>11} {'peak MB':>8}")
+    for section, s in result['sections'].items():
+        print(f"  {section:<8} {s['reruns']:>6} {s['mean_ms']:>9.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+              f"{s['max_ms']:>9.1f} {s['payload_bytes']:>11,} {s['peak_traced_mb']:>8.1f}")
+    for section, message in result['errors']:
+        print(f"  ERROR in {section}: {message}")
+
+
+def find_regressions(results, baseline, tolerance):
+    """Sections whose p95 latency or payload grew by more than `tolerance` against the baseline."""
+    previous = {(r['rows'], r['sessions'], r['radar_mode'], r.get('test_mode')): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['rows'], result['sessions'], result['radar_mode'], result['test_mode']))
+        if before is None:
+            continue
+        for section, s in result['sections'].items():
+            old = before['sections'].get(section)
+            if old is None:
+                continue
+            for metric in ('p95_ms', 'payload_bytes'):
+                if old[metric] and s[metric] > old[metric] * (1 + tolerance):
+                    regressions.append(f"{result['rows']:,} rows / {section}: {metric} "
+                                       f"{old[metric]:,.1f} -> {s[metric]:,.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless load test for the Wild Values app.")
+    parser.add_argument('--rows', type=int, nargs='+', default=list(DEFAULT_ROWS),
+                        help="Reference population sizes to test (default: 10000 100000 1000000)")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1],
+                        help="Numbers of concurrent simulated users (default: 1)")
+    parser.add_argument('--radar-mode', help="Radar background mode to request (default: the app's default)")
+    parser.add_argument('--test-mode', help="Questionnaire mode to request: form, pages or live (default: the app's)")
+    parser.add_argument('--binary', action='store_true', help="Also write binary copies of the reference files")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Record peak traced memory per section (slows everything down)")
+    parser.add_argument('--cold-start', action='store_true',
+                        help="Only measure the intro page's time to first paint in fresh processes")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed growth over the baseline before failing (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    if args.cold_start:
+        result = measure_cold_start()
+        print(f"intro: first paint {result['first_paint_ms']:.0f} ms, warm rerun {result['warm_rerun_ms']:.0f} ms")
+        return
+
+    if args.trace_memory:
+        tracemalloc.start()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in args.rows:
+            for sessions in args.sessions:
+                result = run_scenario(n_rows, sessions, args.radar_mode, args.test_mode, args.trace_memory,
+                                      args.binary, workdir)
+                print_result(result)
+                results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if any(result['errors'] for result in results):
+        sys.exit(1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Compact binary copy of the reference scores.
+
+Scores are whole numbers from 0 to 100, so each one fits in a byte. The file
+is a small header followed by one uint8 column after another:
+
+    offset  size  field
+    0       8     magic b'WVSCORES'
+    8       2     schema version (little-endian uint16)
+    10      2     number of columns
+    12      8     number of rows (uint64)
+    20      32    SHA-256 of the CSV the file was converted from
+    52      4     offset of the column data
+    56      ...   column names, each a uint16 length + UTF-8 bytes
+    ...           zero padding to a multiple of 64 bytes, then the column data
+
+The loader memory-maps the file read-only, so every server process on a machine
+shares one page-cache copy instead of parsing its own int64 DataFrame.
+
+Convert a CSV with:
+
+    python binary_scores.py scores.csv          # writes scores.wvs
+"""
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+from reference_data import file_sha256
+
+MAGIC = b'WVSCORES'
+SCHEMA_VERSION = 1
+EXTENSION = '.wvs'
+_HEADER = struct.Struct('<8sHHQ32sI')
+_ALIGNMENT = 64
+
+
+class StaleBinaryError(ValueError):
+    """The binary file does not match the CSV it is supposed to mirror."""
+
+
+def binary_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + EXTENSION
+
+
+def write_binary(csv_path, output_path=None, sha256=None):
+    """Convert a scores CSV to the binary format. Returns the path written."""
+    output_path = output_path or binary_path_for(csv_path)
+    if sha256 is None:
+        sha256 = file_sha256(csv_path)
+
+    d = pd.read_csv(csv_path)
+    values = d.to_numpy(dtype='float64')
+    if np.isnan(values).any() or (values < 0).any() or (values > 255).any() or (values != np.round(values)).any():
+        raise ValueError(f"{csv_path} must contain only whole numbers from 0 to 255 to be stored as uint8")
+
+    names = b''.join(struct.pack('<H', len(n)) + n for n in (str(c).encode('utf-8') for c in d.columns))
+    data_offset = -(-(_HEADER.size + len(names)) // _ALIGNMENT) * _ALIGNMENT
+    header = _HEADER.pack(MAGIC, SCHEMA_VERSION, d.shape[1], d.shape[0], bytes.fromhex(sha256), data_offset)
+
+    # Write next to the target and rename, so readers never see a half-written file
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header + names)
+        f.write(b'\0' * (data_offset - len(header) - len(names)))
+        f.write(np.ascontiguousarray(values.T, dtype='uint8').tobytes())
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _read_exactly(f, size, path):
+    # A file cut short (e.g. by an interrupted copy) fails as ValueError, like any other bad file
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError(f"{path} is truncated")
+    return data
+
+
+def read_binary(path, expected_sha256=None):
+    """
+    Memory-map a binary scores file as a read-only DataFrame (uint8 columns).
+
+    Raises StaleBinaryError if `expected_sha256` is given and the file was
+    converted from a different CSV, and ValueError if it is not a scores file
+    or is truncated.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{path} is not a Wild Values binary scores file")
+        magic, version, n_cols, n_rows, sha256, data_offset = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Wild Values binary scores file")
+        if version != SCHEMA_VERSION:
+            raise StaleBinaryError(f"{path} has schema version {version}, expected {SCHEMA_VERSION}")
+        if expected_sha256 is not None and sha256.hex() != expected_sha256:
+            raise StaleBinaryError(f"{path} was converted from a different version of the CSV")
+        columns = []
+        for _ in range(n_cols):
+            (length,) = struct.unpack('<H', _read_exactly(f, 2, path))
+            columns.append(_read_exactly(f, length, path).decode('utf-8'))
+        if os.fstat(f.fileno()).st_size < data_offset + n_cols * n_rows:
+            raise ValueError(f"{path} is truncated")
+
+    data = np.memmap(path, dtype='uint8', mode='r', offset=data_offset, shape=(n_cols, n_rows))
+    # The transpose is a view, so the DataFrame's single block is the mapped file itself
+    return pd.DataFrame(data.T, columns=columns, copy=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a scores CSV to the compact binary format.")
+    parser.add_argument('csv', help="Scores CSV, e.g. scores.csv")
+    parser.add_argument('-o', '--output', help=f"Binary file to write (default: the CSV path with {EXTENSION})")
+    args = parser.parse_args(argv)
+
+    output_path = write_binary(args.csv, args.output)
+    print(f"Wrote {output_path} ({os.path.getsize(output_path):,} bytes)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
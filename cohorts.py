@@ -0,0 +1,101 @@
+"""
+The populations a user can be compared against.
+
+Each cohort is a reference file in the scores.csv layout: a trust's members, a
+survey wave, everyone who has taken the test online, and so on. Cohorts are
+listed in a JSON file named by WILD_VALUES_COHORTS:
+
+    [
+      {"name": "supporters", "member": "Wildlife Trust supporter", "path": "scores.csv"},
+      {"name": "wave2", "member": "2024 survey respondent", "path": "scores_wave2.csv"},
+      {"name": "public", "member": "person taking the test online", "path": "scores_live.csv",
+       "members": "people taking the test online"}
+    ]
+
+The first cohort is the default. Without the file there is a single cohort of
+Wildlife Trust supporters read from WILD_VALUES_SCORES (default scores.csv).
+
+Listing a cohort costs nothing: its reference data is only read when a session
+first asks for it, and then lives in the reference cache, which drops the least
+recently used cohorts once they exceed its memory budget (see reference_data.py).
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from reference_data import load_reference
+
+
+@dataclass(frozen=True)
+class Cohort:
+    name: str
+    # One person in the cohort, as in "the average Wildlife Trust supporter"
+    member: str
+    path: str
+    # Plural of `member`; defaults to member + 's'
+    members: str = None
+    # Whether live submissions are folded into this cohort's statistics (WILD_VALUES_LIVE_STATS)
+    live: bool = False
+
+    def __post_init__(self):
+        if self.members is None:
+            object.__setattr__(self, 'members', self.member + 's')
+
+    def reference(self):
+        """The cohort's ReferenceData, loaded (or revalidated) through the reference cache."""
+        return load_reference(self.path)
+
+
+class CohortRegistry:
+    """Cohorts by name, in the order they were listed."""
+
+    def __init__(self, cohorts):
+        self._cohorts = OrderedDict((cohort.name, cohort) for cohort in cohorts)
+        if not self._cohorts:
+            raise ValueError("At least one cohort is needed")
+
+    @classmethod
+    def from_file(cls, path):
+        """Read a JSON list of cohorts; relative paths are taken from the file's directory."""
+        with open(path) as f:
+            entries = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        return cls(Cohort(**dict(entry, path=os.path.join(base, entry['path']))) for entry in entries)
+
+    @property
+    def names(self):
+        return list(self._cohorts)
+
+    @property
+    def default(self):
+        return next(iter(self._cohorts.values()))
+
+    def get(self, name):
+        """The named cohort, or the default one if there is no such cohort."""
+        return self._cohorts.get(name, self.default)
+
+    def __getitem__(self, name):
+        return self._cohorts[name]
+
+    def __len__(self):
+        return len(self._cohorts)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """The process-wide registry, read from WILD_VALUES_COHORTS on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            path = os.environ.get('WILD_VALUES_COHORTS')
+            if path:
+                _registry = CohortRegistry.from_file(path)
+            else:
+                _registry = CohortRegistry([Cohort('supporters', 'Wildlife Trust supporter',
+                                                   os.environ.get('WILD_VALUES_SCORES', 'scores.csv'), live=True)])
+        return _registry
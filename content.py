@@ -0,0 +1,155 @@
+"""
+Static content of the Wild Values app: page text, type descriptions and the logo.
+
+This module is imported once per server process, so everything here is built
+once and served from memory on every rerun, instead of being rebuilt by the
+app script each time.
+"""
+import io
+import logging
+import os
+import threading
+from functools import lru_cache
+
+from reference_data import on_evict
+
+logger = logging.getLogger(__name__)
+
+# Width (pixels) the sidebar logo is stored at: twice the sidebar's width, for high-DPI screens
+LOGO_WIDTH = 600
+LOGO_PATH = 'logo.png'
+
+intro_text = """
+Are you concerned about the loss of nature and wildlife? Do you think society should be taking action to protect nature before it’s too late?    
+
+If your answer to both of these questions is “yes” then you’re one of many. Most people in the UK are concerned about the loss of nature and wildlife. Most of us agree that nature needs to be protected, but we have many different views about how and why we should go about doing this.
+If we want the same outcomes for nature but have different views about how to achieve those outcomes, then it’s important that we try to understand our own views more completely. It’s surely even more important that we try to understand the views of others. There is no one way to protect nature, just like there is no one way to deliver public services, and no one way to organise society. 
+
+When it comes to issues like organising society, we have long-established ways to measure and understand our views—like whether we’re on the left or the right politically. The same cannot be said for of nature and its protection. Are there distinct ways of thinking about nature and how to protect it? Do these relate to different the different values we hold?
+These are the questions we’re hoping you’ll enjoy helping us answer.
+"""
+
+sub_scale_descriptions = {
+    "1. Valuation": """<div style="font-size: 24px; font-weight: bold; text-align: left;">The Bumble Bee / Wild Economist</b> 🐝 </div><p></p>
+
+   <div style="font-size: 16px; text-align: left;"><p>Wild Economists see the benefits of valuing nature in monetary terms.</p>
+
+<p>A high score in the Valuation scale indicates a strong belief that putting a price on nature is important for its protection.</p>
+<p>{share} percent of {members} are Wild Economists, scoring highest or joint-highest on the Valuation scale.{rank_note}</p>
+<p>You might be interested in conservation initiatives such as <a href=" https://www.ywt.org.uk/how-do-you-restore-degraded-peatland" target="_blank">Yorkshire Wildlife Trust’s peatland restoration</a> and writers like <a href="https://tonyjuniper.com/" target="_blank">Tony Juniper</a>, who has written books on ecosystem services.</p>
+</div>""",
+    "2. Wildness":"""<div style="font-size: 24px; font-weight: bold; text-align: left;">The Lynx / Wilderness Advocate</b> 🐈</div><p></p>
+    <div style="font-size: 16px; text-align: left;"><p>Wilderness Advocates have a preference for wild and unmanaged landscapes versus management-intensive conservation.</p>
+    <p>A high score on the Wildness scale suggests you favour minimal human intervention in natural landscapes, and favour rewilding-based approaches to conservation.</p>
+    <p>{share} percent of {members} are Wilderness Advocates, scoring highest or joint-highest on the Wildness scale.{rank_note}</p>
+    <p>You might be interested in conservation initiatives such as <a href=" https://www.missinglynxproject.org.uk/" target="_blank">The Missing Lynx Project</a>, the documentary <a href="https://www.wildingmovie.com/" target="_blank">Wilding</a> and writers like <a href="https://en.wikipedia.org/wiki/Aldo_Leopold" target="_blank">Aldo Leopold</a>.</p>     
+ </div>""",
+    "3. Capitalism": """<div style="font-size: 24px; font-weight: bold; text-align: left;">The Ant / Nature Entrepreneur</b> 🐜 </div><p></p>
+<div style="font-size: 16px; text-align: left;"><p>Nature Entrepreneurs tend to believe that businesses can play an important role in conservation.</p>
+<p>A high score on the Capitalism scale suggests you believe that businesses should play a significant role in protecting nature.</p>
+<p>{share} percent of {members} are Nature Entrepreneurs, scoring highest or joint-highest on the Capitalism scale.{rank_note}</p>
+<p>You might be interested in conservation initiatives such as the <a href="https://www.wildlifetrusts.org/atlantic-rainforest-restoration" target="_blank">Atlantic Rainforest Restoration Programme</a> and <a href="https://www.cornwallwildlifetrust.org.uk/news/seasalt-partners-cornwall-wildlife-trust-pioneering-seagrass-restoration-project" target="_blank">Cornwall Wildlife Trust’s seagrass restoration project</a>.</p>    
+</div>""",
+    "4. Science": """<div style="font-size: 24px; font-weight: bold; text-align: left;">The Dolphin / Wild Scientist</b> 🐬</div><p></p>
+<div style="font-size: 16px; text-align: left;">
+<p>Wild Scientists value scientific knowledge and methods in conservation. A high score on the Science scale indicates a strong preference on science for making conservation decisions.</p>
+<p>{share} percent of {members} are Wild Scientists, scoring highest or joint-highest on the Science scale.{rank_note}</p>
+<p>You might be interested in the work of biological records centres, such as <a href="https://www.surreywildlifetrust.org/what-we-do/professional-services/records-centre" target="_blank">Surrey Wildlife Trust’s</a>, writers like <a href="https://en.wikipedia.org/wiki/E.O._Wilson" target="_blank">E.O. Wilson</a> and documentaries such as <a href="https://theendofthelinemovie.com/" target="_blank">The End of The Line</a>.</p>    
+</div>""",
+    "5. Animals":"""<div style="font-size: 24px; font-weight: bold; text-align: left;">The Octopus / Compassionate Protector</b> 🐙 </div><p></p>
+<div style="font-size: 16px; text-align: left;">
+<p>Compassionate Protectors prioritise the rights of animals in conservation. A high score reflects a strong concern for animal welfare in conservation efforts.</p>
+<p>{share} percent of {members} are Compassionate Protectors, scoring highest or joint-highest on the Animals scale.{rank_note}</p>
+<p>You might be interested in the work of many organisations to <a href="https://squirrelaccord.uk/news/blog/press-notice-grey-squirrel-fertility-control-research-hits-key-milestone/" target="_blank">manage grey squirrels compassionately</a> and philosophers like <a href="https://en.wikipedia.org/wiki/Peter_Singer" target="_blank">Peter Singer</a>.</p>
+</div>""",
+    "6. People":"""<div style="font-size: 24px; font-weight: bold; text-align: left;">The Oak / Wild Egalitarian</b> 🌳 </div><p></p>
+<div style="font-size: 16px; text-align: left;">
+<p>Wild Egalitarians prioritise the benefits to people in conservation work. A high score suggests that you regard the access and involvement of local communities in conservation work as particularly important.</p>
+<p>{share} percent of {members} are Wild Egalitarians, scoring highest or joint-highest on the People scale.{rank_note}</p>
+<p>You might be interested in The Wildlife Trusts’ <a href="https://www.wildlifetrusts.org/nextdoor-nature" target="_blank">Nextdoor Nature Project</a> and writers like <a href="https://en.wikipedia.org/wiki/Richard_Louv" target="_blank">Richard Louv</a>.</p>
+</div>"""
+}
+
+
+sidebar_html = """
+        <div style="text-align: justify; word-wrap: break-word;">
+                By taking the Wild Values test, we’re inviting you to explore your relationship to nature,
+                and to share your views on protecting nature. There are no correct answers to any of the questions.
+                The questions are opportunities to think about the how and why of protecting nature.
+        </div>
+        """
+
+
+def _scaled_logo_path(path, width):
+    return f"{os.path.splitext(path)[0]}.{width}px.png"
+
+
+@lru_cache(maxsize=None)
+def logo_png(path=LOGO_PATH, width=LOGO_WIDTH):
+    """
+    The logo as PNG bytes, scaled down to `width` once per process.
+
+    Given a file path, st.image decodes and resizes the full-size logo (4500 x
+    4500) on every rerun; given bytes already small enough, it passes them through.
+    The scaled copy is also kept next to the logo (e.g. logo.600px.png), so later
+    processes skip the half-second decode as well.
+    """
+    scaled_path = _scaled_logo_path(path, width)
+    try:
+        if os.stat(scaled_path).st_mtime_ns >= os.stat(path).st_mtime_ns:
+            with open(scaled_path, 'rb') as f:
+                return f.read()
+    except OSError:
+        pass
+
+    from PIL import Image
+
+    with Image.open(path) as image:
+        if image.width > width:
+            # reducing_gap box-filters most of the way down first, which is much faster
+            # than a full Lanczos pass over the original and looks the same at this size
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS,
+                                 reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+    data = buffer.getvalue()
+
+    # Write next to the target and rename, so other processes never read a partial file
+    try:
+        tmp_path = f"{scaled_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, scaled_path)
+    except OSError as e:
+        logger.warning("Could not cache the scaled logo at %s: %s", scaled_path, e)
+    return data
+
+
+_type_descriptions = {}
+_type_descriptions_lock = threading.Lock()
+
+
+def type_descriptions(reference, members='Wildlife Trust supporters'):
+    """
+    sub_scale_descriptions with the reference population's type shares filled in
+    (see type_distribution.py), built once per reference file and cohort name.
+    """
+    key = (reference.sha256, members)
+    with _type_descriptions_lock:
+        descriptions = _type_descriptions.get(key)
+        if descriptions is None:
+            shares = reference.type_shares
+            rank_notes = {shares.idxmin(): f" This is the rarest type among {members}.",
+                          shares.idxmax(): f" This is the most common type among {members}."}
+            descriptions = _type_descriptions[key] = {
+                category: description.format(share=round(shares[category]), members=members,
+                                             rank_note=rank_notes.get(category, ''))
+                for category, description in sub_scale_descriptions.items()}
+        return descriptions
+
+
+@on_evict
+def _forget_reference(sha256):
+    with _type_descriptions_lock:
+        for key in [key for key in _type_descriptions if key[0] == sha256]:
+            del _type_descriptions[key]
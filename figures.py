@@ -0,0 +1,476 @@
+"""
+Plotly figure builders for the Wild Values results pages.
+
+The radar chart draws every respondent in the reference population behind the
+average and the user's own scores. How that background is drawn is controlled by
+the radar mode:
+
+- 'traces':  one Scatterpolar trace per respondent (the original rendering)
+- 'lines':   all respondents in a single WebGL trace, separated by gaps
+- 'density': respondents' outlines pre-binned into a polar density layer,
+             so the payload no longer grows with the population
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from reference_data import on_evict, percentile_label
+
+# plotly is imported inside the builders (see _graph_objects), so the app's intro
+# and test pages never pay for it; only the first visit to a results page does
+
+RADAR_MODES = ('traces', 'lines', 'density')
+DEFAULT_RADAR_MODE = os.environ.get('WILD_VALUES_RADAR_MODE', 'lines')
+if DEFAULT_RADAR_MODE not in RADAR_MODES:
+    DEFAULT_RADAR_MODE = 'lines'
+
+BACKGROUND_LINE = dict(width=1, color='rgba(255,255,255, 0.1)')
+
+# Density layer resolution: angle bins in degrees, radius bins in score points,
+# and how many points each polygon edge is sampled at before binning
+DENSITY_THETA_STEP = 3
+DENSITY_R_STEP = 2.5
+DENSITY_EDGE_SAMPLES = 24
+RADIAL_RANGE = [0, 110]
+
+# Radar chart title; `member` names one person in the comparison cohort (see cohorts.py)
+RADAR_TITLE = "How you (orange) compare to the average {member} (teal):"
+DEFAULT_MEMBER = 'Wildlife Trust supporter'
+
+
+def _graph_objects():
+    """
+    plotly.graph_objects, after switching plotly to the standard library JSON engine.
+
+    When orjson is installed plotly serializes with it by default, and with
+    orjson 3.8 every serialization leaks the numpy copies Figure.to_dict makes,
+    about 14 KB a figure. That includes each st.plotly_chart call, on every
+    rerun, so a long-running server would grow without bound.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    pio.json.config.default_engine = 'json'
+    return go
+
+
+def radar_theta(n):
+    """Angles (degrees) of the n dimension spokes, closing back onto the first."""
+    theta = np.arange(n + 1) * (360.0 / n)
+    theta[-1] = 0.0
+    return theta
+
+
+def _closed(values):
+    """Append the first column so each polygon closes on itself."""
+    values = np.asarray(values, dtype='float32')
+    return np.concatenate([values, values[..., :1]], axis=-1)
+
+
+def radar_background_traces(frame, mode=DEFAULT_RADAR_MODE):
+    """Return the population background for the radar chart as a list of traces."""
+    go = _graph_objects()
+
+    if mode not in RADAR_MODES:
+        raise ValueError(f"Unknown radar mode {mode!r}, expected one of {RADAR_MODES}")
+    values = frame.to_numpy()
+    theta = radar_theta(values.shape[1])
+
+    if mode == 'traces':
+        return [
+            go.Scatterpolar(r=row.tolist(), theta=theta.tolist(), mode='lines',
+                            line=BACKGROUND_LINE, hoverinfo='skip')
+            for row in _closed(values)
+        ]
+
+    if mode == 'lines':
+        # One polyline per respondent, with a NaN gap between respondents
+        n = len(values)
+        r = np.full((n, len(theta) + 1), np.nan, dtype='float32')
+        r[:, :-1] = _closed(values)
+        t = np.empty_like(r)
+        t[:] = np.append(theta, np.nan)
+        return [go.Scatterpolargl(r=r.ravel(), theta=t.ravel(), mode='lines',
+                                  line=BACKGROUND_LINE, hoverinfo='skip')]
+
+    return [_density_trace(values, theta)]
+
+
+def _density_trace(values, theta):
+    go = _graph_objects()
+
+    # Sample points along every polygon edge in cartesian space...
+    rad = np.deg2rad(theta)
+    r = _closed(values).astype('float64')
+    x, y = r * np.cos(rad), r * np.sin(rad)
+    s = np.linspace(0, 1, DENSITY_EDGE_SAMPLES, endpoint=False)[:, None, None]
+    px = x[:, :-1] + s * (x[:, 1:] - x[:, :-1])
+    py = y[:, :-1] + s * (y[:, 1:] - y[:, :-1])
+
+    # ...then bin them by angle and radius in one pass
+    n_theta = int(360 / DENSITY_THETA_STEP)
+    n_r = int(np.ceil(RADIAL_RANGE[1] / DENSITY_R_STEP))
+    t_bin = (np.rad2deg(np.arctan2(py, px)) % 360 // DENSITY_THETA_STEP).astype('int64')
+    r_bin = np.minimum(np.hypot(px, py) // DENSITY_R_STEP, n_r - 1).astype('int64')
+    counts = np.bincount((r_bin * n_theta + t_bin).ravel(), minlength=n_r * n_theta)
+
+    cells = np.flatnonzero(counts)
+    r_idx, t_idx = np.divmod(cells, n_theta)
+    # Square root keeps sparse outer regions visible next to the dense core
+    density = np.sqrt(counts[cells] / counts.max())
+    return go.Barpolar(
+        base=(r_idx * DENSITY_R_STEP).astype('float32'),
+        r=np.full(len(cells), DENSITY_R_STEP, dtype='float32'),
+        theta=((t_idx + 0.5) * DENSITY_THETA_STEP).astype('float32'),
+        width=DENSITY_THETA_STEP,
+        marker=dict(color=density.astype('float32'), cmin=0, cmax=1, line_width=0,
+                    colorscale=[[0, 'rgba(255,255,255,0)'], [1, 'rgba(255,255,255,0.9)']]),
+        hoverinfo='skip',
+    )
+
+
+class FigureCache:
+    """
+    Bounded, thread-safe LRU cache of built figures (or figure parts).
+
+    Cached values are shared between sessions and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+            self.misses += 1
+        # Build outside the lock; two sessions racing on one key just build it twice
+        fig = build()
+        with self._lock:
+            self._figures[key] = fig
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+        return fig
+
+    def discard(self, predicate):
+        """Drop every figure whose key matches `predicate`."""
+        with self._lock:
+            for key in [key for key in self._figures if predicate(key)]:
+                del self._figures[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._figures), 'maxsize': self.maxsize, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+# Population-only figures, one per reference file (and radar mode). They hold only
+# what the reference rows determine, so live statistics (see running_stats.py)
+# reuse them across versions; the averages and histogram bars are added per figure
+base_figures = FigureCache(maxsize=int(os.environ.get('WILD_VALUES_BASE_FIGURE_CACHE_SIZE', 16)))
+# What each result adds to its base figure (see _Additions), keyed by the user's
+# normalized score vector. Only the additions are cached, not the finished figure:
+# each finished figure would hold its own copy of the base, megabytes for a large
+# population, so the results are composed with the shared base on every call
+result_figures = FigureCache(maxsize=int(os.environ.get('WILD_VALUES_FIGURE_CACHE_SIZE', 512)))
+
+
+@on_evict
+def _forget_reference(sha256):
+    # Base figures are keyed (kind, sha256, ...), additions (kind, reference.cache_key, ...)
+    base_figures.discard(lambda key: key[1] == sha256)
+    result_figures.discard(lambda key: key[1][0] == sha256)
+
+
+def figure_cache_stats():
+    return {'base': base_figures.stats(), 'results': result_figures.stats()}
+
+
+def _extend(base, traces=(), shapes=(), annotations=(), title=None, layout_updates=None):
+    """
+    A copy of a cached base figure with traces, shapes and annotations added, and
+    `layout_updates` ({'yaxis2': {'range': ...}, ...}) merged into its layout.
+
+    go.Figure(base) would re-validate every property of the base figure, which
+    was validated when it was built; copying its plain dict skips that. Only the
+    additions, passed as graph objects, are validated.
+    """
+    go = _graph_objects()
+
+    spec = base.to_dict()
+    spec['data'].extend(trace.to_plotly_json() for trace in traces)
+    layout = spec['layout']
+    if shapes:
+        layout['shapes'] = layout.get('shapes', []) + [shape.to_plotly_json() for shape in shapes]
+    if annotations:
+        layout['annotations'] = layout.get('annotations', []) + [a.to_plotly_json() for a in annotations]
+    if title is not None:
+        layout['title']['text'] = title
+    for name, update in (layout_updates or {}).items():
+        layout.setdefault(name, {}).update(update)
+    return go.Figure(spec, _validate=False)
+
+
+class _Additions:
+    """The user-dependent part of a figure: the arguments _extend adds to its base."""
+
+    def __init__(self, **changes):
+        self.changes = changes
+        self.payload_bytes = None
+
+    def compose(self, base):
+        fig = _extend(base, **self.changes)
+        # Every composition serializes to the same JSON (see figure_payload_bytes)
+        fig._additions = self
+        fig._payload_bytes = self.payload_bytes
+        return fig
+
+
+def _score_key(reference, user_scores):
+    return tuple(int(user_scores[c]) for c in reference.categories)
+
+
+def _radar_base_figure(reference, mode):
+    """The radar chart's population background and layout, without the average or the user's scores."""
+    go = _graph_objects()
+
+    categories = reference.categories
+    theta = radar_theta(len(categories))
+
+    fig = go.Figure()
+    fig.add_traces(radar_background_traces(reference.frame, mode))
+
+    # Update layout of the plot
+    fig.update_layout(
+        title={
+            'text': RADAR_TITLE.format(member=DEFAULT_MEMBER),
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        title_font_size=20,  # Adjust the font size of the title
+        showlegend=False,
+        polar=dict(
+            bgcolor="lightgrey",
+            radialaxis=dict(
+                visible=True,
+                range=RADIAL_RANGE,  # Assuming the scores are normalized to 0-100
+                tickfont=dict(size=12, color='black')
+            ),
+            angularaxis=dict(
+                # Numeric angles labelled with the dimension names, so every
+                # radar mode (including the density layer) shares one axis
+                tickmode='array',
+                tickvals=theta[:-1].tolist(),
+                ticktext=categories,
+                rotation=90,  # Rotate to start from 12 o'clock position
+                direction="clockwise"  # Ensure clockwise direction
+            ),
+            bargap=0
+        ),
+        width=900,  # Specify the width of the plot in pixels
+        height=900,
+        margin=dict(l=50, r=50, t=100, b=50)
+    )
+    return fig
+
+
+def _radar_base(reference, mode):
+    return base_figures.get(('radar', reference.sha256, mode), lambda: _radar_base_figure(reference, mode))
+
+
+def _radar_additions(reference, user_scores, member):
+    """The average and the user's scores, and the cohort's title, for the radar chart."""
+    go = _graph_objects()
+
+    categories = reference.categories
+    theta = radar_theta(len(categories))
+
+    # Plot Mean
+    mean_trace = go.Scatterpolar(
+        r=_closed(reference.avs.values).tolist(),
+        theta=theta.tolist(),
+        text=categories + [categories[0]],
+        mode='lines',
+        name='Average score',
+        fill='toself',
+        line=dict(width=3, color='rgba(108, 156, 153, 1)'),  # Solid line for the mean
+        hoveron='points+fills',
+        fillcolor='rgba(108, 156, 153, 0.7)',
+        hovertemplate='Average score: %{r}<br>Dimension: %{text}<extra></extra>'
+    )
+
+    # Plot your result
+    user_trace = go.Scatterpolar(
+        r=_closed([user_scores[c] for c in categories]).tolist(),
+        theta=theta.tolist(),
+        text=categories + [categories[0]],
+        mode='lines',
+        name='Your score',
+        line=dict(width=3, color='rgba(255, 176, 75, 1)'),  # Solid line for your score
+        hoveron='points+fills',
+        fillcolor='rgba(255, 176, 75, 0.7)',
+        hovertemplate='Your score: %{r}<br>Dimension: %{text}<extra></extra>'
+    )
+    # The base figure is shared by every cohort using the same reference file
+    title = RADAR_TITLE.format(member=member) if member != DEFAULT_MEMBER else None
+    return _Additions(traces=[mean_trace, user_trace], title=title)
+
+
+def build_radar_figure(reference, user_scores, mode=DEFAULT_RADAR_MODE, member=DEFAULT_MEMBER):
+    """Radar chart of the user's normalized scores against the reference population."""
+    return _radar_additions(reference, user_scores, member).compose(_radar_base(reference, mode))
+
+
+def cached_radar_figure(reference, user_scores, mode=DEFAULT_RADAR_MODE, member=DEFAULT_MEMBER):
+    """build_radar_figure(), with the user-dependent part memoized on the score vector."""
+    key = ('radar', reference.cache_key, mode, member, _score_key(reference, user_scores))
+    additions = result_figures.get(key, lambda: _radar_additions(reference, user_scores, member))
+    return additions.compose(_radar_base(reference, mode))
+
+
+def _details_base_figure(reference):
+    """The histogram panel's subplots and layout, without any bars or lines."""
+    from plotly.subplots import make_subplots
+
+    categories = reference.categories
+
+    # Initialize a figure with subplots (2 columns, 3 rows)
+    fig2 = make_subplots(rows=3, cols=2, subplot_titles=categories)
+
+    # Update layout for the entire figure
+    fig2.update_layout(
+        title={
+            'text': "Your results in detail:",
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top'
+        },
+        title_font_size=20,
+        xaxis_title='',
+        yaxis_title="Frequency",
+        bargap=0,      # No gap between bars
+        bargroupgap=0,  # No gap between groups of bars
+        plot_bgcolor='lightgrey',  # Background color of the entire plot
+        showlegend=False,          # Do not show legend for individual histograms
+        height=1200,               # Set the total height of the figure
+        width=1200,                # Set the width of the figure
+        margin=dict(l=50, r=50, t=150, b=50)
+    )
+
+    for annotation in fig2['layout']['annotations']:
+        annotation['y'] += 0.03  # Move subplot titles further upwards
+    return fig2
+
+
+def _details_base(reference):
+    return base_figures.get(('details', reference.sha256), lambda: _details_base_figure(reference))
+
+
+def _details_additions(reference, user_scores):
+    """
+    The histograms, averages and the user's scores for the details panel.
+
+    The bars are drawn from the bin counts cached with the reference data, so the
+    figure stays the same size however large the reference population is. Only
+    the subplot layout is in the base figure; the bars and averages are cheap to
+    add, and change with every version of live statistics.
+    """
+    go = _graph_objects()
+
+    counts, edges = reference.histogram_counts, reference.histogram_edges
+    centres = ((edges[:-1] + edges[1:]) / 2).tolist()
+    widths = np.diff(edges).tolist()
+
+    # The lines and labels add_vline(row=, col=, annotation_position=...) would draw,
+    # written out directly: add_vline costs ~90 ms a call inspecting the subplots
+    traces, shapes, annotations, axes = [], [], [], {}
+    for i, col in enumerate(reference.categories):
+        # Subplots are numbered row by row; the first one's axes have no number
+        axis = '' if i == 0 else str(i + 1)
+
+        # Create histogram trace from the pre-binned counts
+        traces.append(go.Bar(
+            x=centres,
+            y=counts[i].tolist(),
+            width=widths,
+            name='Data',
+            marker=dict(
+                color='rgba(255, 255, 255, 0.9)',
+                line=dict(
+                    color='black',  # Outline color
+                    width=1      # Outline width
+                )
+            ),
+            hovertemplate='%{y} people scored in this range<extra></extra>',
+            xaxis=f'x{axis}',
+            yaxis=f'y{axis}',
+        ))
+
+        # Set the upper limit for y-axis from the tallest bin
+        axes[f'yaxis{axis}'] = {'range': [0, counts[i].max() * 1.3]}
+
+        # Vertical line for the mean score
+        average = reference.avs.iloc[i]
+        shapes.append(go.layout.Shape(type='line', x0=average, x1=average, xref=f'x{axis}', y0=0, y1=1,
+                                      yref=f'y{axis} domain', line=dict(color='rgba(108, 156, 153, 0.8)', width=7)))
+        annotations.append(go.layout.Annotation(
+            text=f'Average score: {round(average, 2)}',
+            font=dict(color='rgba(255, 255, 255, 1)', weight='bold', size=15), showarrow=False,
+            x=average, xref=f'x{axis}', xanchor='center',
+            y=1.05, yref=f'y{axis} domain', yanchor='bottom',  # Above the subplot titles
+        ))
+
+    # Vertical lines for the user's scores, drawn over the averages
+    for i, col in enumerate(reference.categories):
+        axis = '' if i == 0 else str(i + 1)
+        score = user_scores[col]
+        percentile = percentile_label(reference.index.percentile_rank(col, score))
+        shapes.append(go.layout.Shape(type='line', x0=round(score), x1=round(score), xref=f'x{axis}', y0=0, y1=1,
+                                      yref=f'y{axis} domain', line=dict(color='rgba(255, 176, 75, 0.8)', width=7)))
+        annotations.append(go.layout.Annotation(
+            text=f'Your score: {round(score, 2)} ({percentile} percentile)',
+            font=dict(color='rgba(0, 0, 0, 1)', weight='bold', size=15), showarrow=False,
+            x=round(score), xref=f'x{axis}', xanchor='left',
+            y=1.03, yref=f'y{axis} domain', yanchor='top',  # Level with the subplot titles
+        ))
+    return _Additions(traces=traces, shapes=shapes, annotations=annotations, layout_updates=axes)
+
+
+def build_details_figure(reference, user_scores):
+    """Panel of per-dimension histograms with the average and the user's score."""
+    return _details_additions(reference, user_scores).compose(_details_base(reference))
+
+
+def cached_details_figure(reference, user_scores):
+    """build_details_figure(), with the user-dependent part memoized on the score vector."""
+    key = ('details', reference.cache_key, _score_key(reference, user_scores))
+    additions = result_figures.get(key, lambda: _details_additions(reference, user_scores))
+    return additions.compose(_details_base(reference))
+
+
+def figure_payload_bytes(fig):
+    """
+    Size of the figure JSON that is sent to the browser.
+
+    Measured once per figure and remembered on it, and on the cached additions it
+    was composed from, which is only valid because figures are never modified.
+    """
+    size = getattr(fig, '_payload_bytes', None)
+    if size is None:
+        size = fig._payload_bytes = len(fig.to_json().encode('utf-8'))
+        additions = getattr(fig, '_additions', None)
+        if additions is not None:
+            additions.payload_bytes = size
+    return size
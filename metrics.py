@@ -0,0 +1,236 @@
+"""
+Where the app's time goes, per section.
+
+The app times named phases of each rerun (data load, scoring, figure build,
+serialization) under the section being shown, and counts reruns and new
+sessions. Nothing is recorded unless one of these is set:
+
+    WILD_VALUES_METRICS_PORT=9464   serve Prometheus text format on
+                                    http://127.0.0.1:9464/metrics
+    WILD_VALUES_METRICS_LOG=1       log one JSON line per rerun (logger 'metrics')
+
+WILD_VALUES_METRICS_ADDR changes the address the endpoint binds to. When both
+are unset, get_metrics() returns a stand-in whose timers do nothing, so the
+instrumented app costs a few hundred nanoseconds more per phase.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the phase duration histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Timer:
+    """Times one phase from creation (or entering the with block) until stop()."""
+
+    def __init__(self, metrics, section, phase):
+        self._metrics = metrics
+        self.section = section
+        self.phase = phase
+        self._start = time.perf_counter()
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        self._metrics.observe(self.section, self.phase, time.perf_counter() - self._start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def stop(self):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """What get_metrics() returns when instrumentation is off: every call is a no-op."""
+    enabled = False
+
+    def phase(self, section, phase):
+        return _NULL_TIMER
+
+    def start_rerun(self, section):
+        return _NULL_TIMER
+
+    def observe(self, section, phase, seconds):
+        pass
+
+    def observe_payload(self, section, n_bytes):
+        pass
+
+    def session_started(self):
+        pass
+
+
+class Metrics:
+    """Process-wide phase timings and counters, shared by every session."""
+    enabled = True
+
+    def __init__(self, log=False):
+        self.log = log
+        self._lock = threading.Lock()
+        # (section, phase) -> [bucket counts..., +Inf count, sum of seconds]
+        self._phases = defaultdict(lambda: [0] * (len(BUCKETS) + 1) + [0.0])
+        self._reruns = defaultdict(int)
+        self._payloads = defaultdict(lambda: [0, 0])          # section -> [bytes, figures]
+        self._sessions = 0
+        # Each session's script runs in its own thread; phases timed there are
+        # gathered into that rerun's log record
+        self._local = threading.local()
+
+    def phase(self, section, phase):
+        """Context manager timing one named phase: `with metrics.phase(section, 'scoring'):`"""
+        return _Timer(self, section, phase)
+
+    def start_rerun(self, section):
+        """Start timing a whole rerun of `section`; call stop() on the result at the end of the script."""
+        self._local.record = {'section': section, 'phases': {}, 'payload_bytes': 0,
+                              # Callbacks run before the script, so their phases belong to this rerun
+                              **getattr(self._local, 'pending', {})}
+        self._local.pending = {}
+        return _Timer(self, section, 'rerun')
+
+    def observe(self, section, phase, seconds):
+        with self._lock:
+            entry = self._phases[(section, phase)]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[i] += 1
+                    break
+            else:
+                entry[len(BUCKETS)] += 1
+            entry[-1] += seconds
+            if phase == 'rerun':
+                self._reruns[section] += 1
+
+        record = getattr(self._local, 'record', None)
+        if phase == 'rerun':
+            self._local.record = None
+            if self.log and record is not None:
+                logger.info(json.dumps(dict(record, event='rerun', seconds=round(seconds, 6))))
+        elif record is not None:
+            record['phases'][phase] = round(record['phases'].get(phase, 0) + seconds, 6)
+        else:
+            pending = self._local.__dict__.setdefault('pending', {})
+            pending.setdefault('phases', {})[phase] = round(seconds, 6)
+
+    def observe_payload(self, section, n_bytes):
+        """Count the bytes of figure JSON sent to the browser."""
+        with self._lock:
+            self._payloads[section][0] += n_bytes
+            self._payloads[section][1] += 1
+        record = getattr(self._local, 'record', None)
+        if record is not None:
+            record['payload_bytes'] += n_bytes
+
+    def session_started(self):
+        with self._lock:
+            self._sessions += 1
+
+    def render(self):
+        """Everything recorded so far, in the Prometheus text exposition format."""
+        with self._lock:
+            phases = {key: list(entry) for key, entry in self._phases.items()}
+            reruns = dict(self._reruns)
+            payloads = {section: list(entry) for section, entry in self._payloads.items()}
+            sessions = self._sessions
+
+        lines = ['# HELP wild_values_phase_seconds Time spent in each phase of a rerun, by section.',
+                 '# TYPE wild_values_phase_seconds histogram']
+        for (section, phase), entry in sorted(phases.items()):
+            labels = f'section="{section}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), entry[:-1]):
+                cumulative += count
+                lines.append(f'wild_values_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'wild_values_phase_seconds_sum{{{labels}}} {entry[-1]:.6f}')
+            lines.append(f'wild_values_phase_seconds_count{{{labels}}} {cumulative}')
+
+        lines += ['# HELP wild_values_reruns_total Script reruns, by the section shown.',
+                  '# TYPE wild_values_reruns_total counter']
+        lines += [f'wild_values_reruns_total{{section="{section}"}} {n}' for section, n in sorted(reruns.items())]
+
+        lines += ['# HELP wild_values_sessions_total Browser sessions started.',
+                  '# TYPE wild_values_sessions_total counter',
+                  f'wild_values_sessions_total {sessions}']
+
+        lines += ['# HELP wild_values_figure_payload_bytes Figure JSON sent to the browser, by section.',
+                  '# TYPE wild_values_figure_payload_bytes summary']
+        for section, (n_bytes, n_figures) in sorted(payloads.items()):
+            lines.append(f'wild_values_figure_payload_bytes_sum{{section="{section}"}} {n_bytes}')
+            lines.append(f'wild_values_figure_payload_bytes_count{{section="{section}"}} {n_figures}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, address='127.0.0.1'):
+        """Serve render() at http://address:port/metrics from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-endpoint', daemon=True).start()
+        return server
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """The process-wide Metrics (or NullMetrics if instrumentation is off), set up on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            port = os.environ.get('WILD_VALUES_METRICS_PORT')
+            log = os.environ.get('WILD_VALUES_METRICS_LOG') == '1'
+            if not (port or log):
+                _metrics = NullMetrics()
+            else:
+                _metrics = Metrics(log=log)
+                if log and not logger.handlers:
+                    # One bare JSON object per line on stderr, ready for a log shipper
+                    handler = logging.StreamHandler()
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger.addHandler(handler)
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                if port:
+                    address = os.environ.get('WILD_VALUES_METRICS_ADDR', '127.0.0.1')
+                    try:
+                        _metrics.serve(int(port), address)
+                    except OSError as e:
+                        # e.g. another server process on this machine already holds the port
+                        logger.warning("Metrics endpoint not started on %s:%s: %s", address, port, e)
+        return _metrics
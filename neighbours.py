@@ -0,0 +1,229 @@
+"""
+"People like you": nearest-neighbour queries over the reference population.
+
+Respondents are points in the six-dimensional space of normalized scores. The
+index quantizes that space into a grid of cubic cells and keeps the points
+sorted by cell, with a prefix count over every cell of the grid. A radius query
+counts the cells lying wholly inside the ball from the prefix counts and only
+checks the points of cells on its boundary, so it never scans every row. New
+responses can be inserted at any time; they are held in a small side buffer and
+merged into the grid in bulk.
+
+In six dimensions a cell's diagonal soon reaches the radius, and then most of
+the ball is boundary. On a million rows a radius of 10 or 12 is answered in
+under a millisecond, 15 in about 1.5 ms and 20 in about 3 ms.
+"""
+import threading
+
+import numpy as np
+
+from reference_data import MAX_SCORE, MIN_SCORE, on_evict
+
+
+# Below this many points a single vectorized scan beats walking the grid
+BRUTE_FORCE_LIMIT = 20_000
+
+
+class NeighbourIndex:
+    """Grid index over integer score vectors, with radius and k-nearest queries."""
+
+    def __init__(self, points, cell_size=8, merge_fraction=0.05):
+        points = np.asarray(points, dtype='int16')
+        self.n_dims = points.shape[1]
+        self.cell_size = cell_size
+        self.merge_fraction = merge_fraction
+        self._cells_per_dim = (MAX_SCORE - MIN_SCORE) // cell_size + 1
+        self._strides = self._cells_per_dim ** np.arange(self.n_dims, dtype='int64')
+        self._lock = threading.Lock()
+
+        self._points = np.empty((max(len(points), 1024), self.n_dims), dtype='int16')
+        self._points[:len(points)] = points
+        self.n = len(points)
+        self._build()
+
+    def _cell_codes(self, points):
+        cells = (np.asarray(points) - MIN_SCORE) // self.cell_size
+        return cells.astype('int64') @ self._strides
+
+    def _build(self):
+        # Points in the grid are [0, _n_indexed); anything after that is pending
+        codes = self._cell_codes(self._points[:self.n])
+        self._order = np.argsort(codes, kind='stable')
+        # A cell-sorted copy keeps each cell's points contiguous in memory
+        self._sorted_points = self._points[self._order].astype('int32')
+        # Prefix counts over every cell of the grid (occupied or not): cell c's points
+        # are _sorted_points[_offsets[c]:_offsets[c + 1]]. The first dimension has
+        # stride 1, so a run of cells along it is one contiguous range as well. At the
+        # default cell size that is 4.8M offsets (19 MB), so small populations, which
+        # are scanned directly, go without.
+        self._offsets = None
+        if self.n > BRUTE_FORCE_LIMIT:
+            counts = np.bincount(codes, minlength=self._cells_per_dim ** self.n_dims)
+            self._offsets = np.zeros(len(counts) + 1, dtype='int32' if self.n < 2 ** 31 else 'int64')
+            np.cumsum(counts, out=self._offsets[1:])
+        self._n_indexed = self.n
+
+    def insert(self, point):
+        """Add one response (a sequence of n_dims scores). Returns its row."""
+        with self._lock:
+            if self.n == len(self._points):
+                self._points = np.concatenate([self._points, np.empty_like(self._points)])
+            self._points[self.n] = point
+            self.n += 1
+            if self.n - self._n_indexed > max(1024, self.merge_fraction * self._n_indexed):
+                self._build()
+            return self.n - 1
+
+    def points(self, rows):
+        """Score vectors of the given rows (as returned by nearest)."""
+        return self._points[rows].copy()
+
+    def _all_points(self, query):
+        diff = self._points[:self.n].astype('int64') - query
+        return np.arange(self.n), np.einsum('ij,ij->i', diff, diff), 0
+
+    def _candidates(self, query, radius, count_inside=True):
+        """
+        Points that may lie within `radius` of `query`, as (row indices, squared
+        distances, n_inside). With `count_inside`, points in cells lying wholly
+        inside the radius are only counted (n_inside) rather than returned.
+        """
+        reach = int(np.ceil(radius))
+        lo = np.clip((query - reach - MIN_SCORE) // self.cell_size, 0, self._cells_per_dim - 1)
+        hi = np.clip((query + reach - MIN_SCORE) // self.cell_size, 0, self._cells_per_dim - 1)
+        if self._offsets is None or np.prod(hi - lo + 1) > self.n:
+            # Walking the cells would cost more than looking at every point
+            return self._all_points(query)
+        r2 = radius * radius
+
+        # Squared distance from the query to the nearest and farthest score of each
+        # cell in range, per dimension
+        nearest, farthest = [], []
+        for d in range(self.n_dims):
+            lower = np.arange(lo[d], hi[d] + 1) * self.cell_size + MIN_SCORE
+            upper = np.minimum(lower + self.cell_size - 1, MAX_SCORE)
+            nearest.append(np.maximum(np.maximum(lower - query[d], query[d] - upper), 0) ** 2)
+            farthest.append(np.maximum(np.abs(query[d] - lower), np.abs(query[d] - upper)) ** 2)
+
+        # Rows of cells along the first dimension that reach into the ball, built up
+        # one further dimension at a time
+        row_nearest, row_farthest = np.zeros(1, dtype='int64'), np.zeros(1, dtype='int64')
+        row_base = np.zeros(1, dtype='int64')
+        for d in range(1, self.n_dims):
+            row_nearest = (row_nearest[:, None] + nearest[d]).ravel()
+            row_farthest = (row_farthest[:, None] + farthest[d]).ravel()
+            row_base = (row_base[:, None] + np.arange(lo[d], hi[d] + 1) * self._strides[d]).ravel()
+            reaches = row_nearest <= r2
+            row_nearest, row_farthest, row_base = row_nearest[reaches], row_farthest[reaches], row_base[reaches]
+
+        # Along each row the cells touching the ball, and those wholly inside it, are
+        # each one run [first, last] (the ball is convex); the query's own cell always touches
+        n_cells = hi[0] - lo[0] + 1
+        touching = row_nearest[:, None] + nearest[0] <= r2
+        first = lo[0] + row_base + touching.argmax(axis=1)
+        end = lo[0] + row_base + n_cells - touching[:, ::-1].argmax(axis=1)
+        if count_inside:
+            inside = row_farthest[:, None] + farthest[0] <= r2
+            has_inside = inside.any(axis=1)
+            inside_first = np.where(has_inside, lo[0] + row_base + inside.argmax(axis=1), end)
+            inside_end = np.where(has_inside, lo[0] + row_base + n_cells - inside[:, ::-1].argmax(axis=1), end)
+            n_inside = int((self._offsets[inside_end] - self._offsets[inside_first]).sum())
+            # The partially covered cells either side of the inside run
+            starts = np.concatenate([self._offsets[first], self._offsets[inside_end]])
+            ends = np.concatenate([self._offsets[inside_first], self._offsets[end]])
+        else:
+            n_inside = 0
+            starts, ends = self._offsets[first], self._offsets[end]
+
+        lengths = (ends - starts).astype('int64')
+        # Concatenate the [start, end) ranges without a Python loop
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        # take() and int32 arithmetic: this gather is most of a query's cost
+        diff = self._sorted_points.take(positions, axis=0) - query.astype('int32')
+        squared = np.einsum('ij,ij->i', diff, diff)
+
+        # Points inserted since the last build are checked directly
+        pending = np.arange(self._n_indexed, self.n)
+        if len(pending):
+            pending_diff = self._points[pending].astype('int32') - query
+            squared = np.concatenate([squared, np.einsum('ij,ij->i', pending_diff, pending_diff)])
+            return np.concatenate([self._order[positions], pending]), squared, n_inside
+        return self._order[positions], squared, n_inside
+
+    def within(self, query, radius, exclude=None):
+        """
+        Number of points within `radius` (Euclidean) of `query`, not counting
+        row `exclude` (e.g. the user's own inserted response).
+        """
+        query = np.asarray(query, dtype='int64')
+        with self._lock:
+            _, squared, n_inside = self._candidates(query, radius)
+            count = n_inside + int(np.count_nonzero(squared <= radius * radius))
+            if exclude is not None:
+                diff = self._points[exclude].astype('int64') - query
+                count -= int(diff @ diff <= radius * radius)
+            return count
+
+    def share_within(self, query, radius, exclude=None):
+        """Percentage of the population (without row `exclude`) within `radius` of `query`."""
+        n = self.n - (exclude is not None)
+        return 100.0 * self.within(query, radius, exclude) / n if n else 0.0
+
+    def nearest(self, query, k=5, exclude=None):
+        """
+        The k nearest points to `query`, other than row `exclude`, as (indices,
+        distances) sorted by distance.
+
+        Indices refer to rows in the order the points were given (then inserted).
+        """
+        query = np.asarray(query, dtype='int64')
+        # Look for one more, in case the excluded row is among them
+        k = min(k + (exclude is not None), self.n)
+        radius = self.cell_size
+        with self._lock:
+            while True:
+                if self.n <= BRUTE_FORCE_LIMIT or radius >= (MAX_SCORE - MIN_SCORE) * np.sqrt(self.n_dims):
+                    # Everything is in range: nothing left to prune
+                    candidates, squared, _ = self._all_points(query)
+                    break
+                # Every point within the radius is among the candidates, so once k of
+                # them are found the answer is exact
+                candidates, squared, _ = self._candidates(query, radius, count_inside=False)
+                if np.count_nonzero(squared <= radius * radius) >= k:
+                    break
+                radius *= 2
+            best = np.argsort(squared, kind='stable')[:k]
+            if exclude is not None:
+                best = best[candidates[best] != exclude][:k - 1]
+            return candidates[best], np.sqrt(squared[best])
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_neighbour_index(reference, seed_rows=None, cohort=None):
+    """
+    The process-wide index over a reference population's rows, built on first use.
+
+    As with get_running_stats, `seed_rows` is called once, when the index is
+    built, for the scores of `cohort`'s responses collected since the reference
+    was made. An index with live responses belongs to that one cohort; the plain
+    index (no `cohort`) is shared by every cohort using the reference file.
+    """
+    key = (reference.sha256, cohort)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            points = reference.frame.to_numpy()
+            if seed_rows is not None:
+                points = np.concatenate([points, np.asarray(seed_rows(), dtype=points.dtype).reshape(-1, points.shape[1])])
+            index = _indexes[key] = NeighbourIndex(points)
+        return index
+
+
+@on_evict
+def _forget_reference(sha256):
+    with _indexes_lock:
+        for key in [key for key in _indexes if key[0] == sha256]:
+            del _indexes[key]
@@ -0,0 +1,70 @@
+"""
+The Wild Values questionnaire: statements, sub-scales and how items are coded.
+
+Kept separate from the Streamlit app so that scoring can run headlessly.
+"""
+
+# Define the statements and sub-scales
+questions = {
+    "1. Valuation": [
+        "Putting a price on nature could lead to it being harmed",
+        "Putting a monetary value on nature gives conservation greater priority in policy choices",
+        "Putting a monetary value on nature helps to protect it",
+        "Putting a value on nature gives it better protection in political and economic decision-making",
+        "It is morally wrong to put a price on nature",
+        "Other economic priorities will always overshadow conservation, regardless of whether nature has a monetary value"
+    ],
+    "2. Wildness": [
+        "The main role of conservation should be to remove human influences from unhealthy landscapes (e.g., fences, powerlines, dams) and allow nature to take its course",
+        "The goal of conservation should be to restore environments to what they would've been before humans modified them and keep them that way",
+        "A landscape managed and controlled by people cannot be called 'natural'",
+        "Attempts to manage nature lead to its degradation",
+        "Wild nature can only be restored by ceasing human interference",
+        "Conservation should aim to convert managed landscapes into wild ones"
+    ],
+    "3. Capitalism": [
+        "Only by working with businesses will conservation receive enough funding to protect nature",
+        "Conservation can be effective without the support of businesses",
+        "Conservation should not have to compromise by working with businesses to protect nature",
+        "Protecting nature will be less successful if nature organisations attempt to leverage businesses to their advantage",
+        "To protect nature, conservation should embrace opportunities to work with businesses",
+        "Governments alone don’t have the financial capacity or resources to look after nature"
+    ],
+    "4. Science": [
+        "Local knowledge is more useful than science when looking after nature",
+        "Nature can only be protected when decisions are based on science",
+        "Decisions about how to care for nature should be based on facts and not opinion",
+        "Decisions about how to look after nature should never be based on just science",
+        "Science is just a small part of helping us decide how to look after nature",
+        "People need science to help protect nature"
+    ],
+    "5. Animals": [
+        "Animals should have rights similar to the rights of people",
+        "The things done to protect nature should not cause any animal to suffer",
+        "Hunting should not be part of looking after nature because it harms individual animals",
+        "Taking care of individual animals is less important than looking after nature as a whole",
+        "Sometimes it is ok to do things that harm animals to protect the natural world (e.g., killing animals that are damaging woodlands)"
+    ],
+     "6. People": [
+        "Local people should have the greatest say in looking after nature",
+        "Work to look after nature should aim to improve access to nature for all",
+        "Disadvantaged people should have a say in how nature is looked after",
+        "It’s ok for people to be inconvenienced in order to conserve nature",
+        "Work to care for nature should have nothing to do with people's wellbeing",
+        "Focus on people’s wellbeing can undermine efforts to look after nature"
+    ]
+}
+
+# Define the labels and corresponding values for the slider
+slider_labels = ["Strongly disagree", "Disagree", "Neutral", "Agree", "Strongly agree"]
+slider_values = [0, 1, 2, 3, 4]
+
+# Define reverse coding map for each item
+reverse_coding_map = {
+    "1. Valuation": [0, 4, 5],
+    "2. Wildness": [],
+    "3. Capitalism": [1, 2, 3],
+    "4. Science": [0, 3, 4],
+    "5. Animals": [3, 4], 
+    "6. People": [3, 4, 5]
+}
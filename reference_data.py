@@ -0,0 +1,306 @@
+"""
+Process-wide cache for the Wild Values reference population.
+
+Streamlit re-executes the app script on every interaction, but imported modules
+stay loaded for the lifetime of the server process. Keeping the parsed reference
+data here means every rerun and every session shares one copy, and the CSV is
+only re-read when its modification time or content actually changes.
+
+Several reference files (cohorts, see cohorts.py) can be cached at once. The
+cache holds them in least-recently-used order within a memory budget
+(WILD_VALUES_REFERENCE_CACHE_MB, default 1024), so adding cohorts does not add
+to the RAM of every process until they are actually used.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from type_distribution import type_shares
+
+logger = logging.getLogger(__name__)
+
+# Column names used in the CSV and the labels used throughout the app
+COLUMN_RENAMES = {'Valuation': '1. Valuation', 'Wildness': '2. Wildness',
+                  'Capitalism': '3. Capitalism', 'Science': '4. Science',
+                  'Animals': '5. Animals', 'People': '6. People'}
+
+# Normalized scores are whole numbers in this range
+MIN_SCORE, MAX_SCORE = 0, 100
+# Bin width of the histograms on the details page
+HISTOGRAM_BIN_WIDTH = 5
+# Memory the cached reference files may use between them before the least recently used is dropped
+MEMORY_BUDGET = int(os.environ.get('WILD_VALUES_REFERENCE_CACHE_MB', 1024)) * 2 ** 20
+
+
+class ScoreIndex:
+    """
+    Per-dimension score counts over the integers MIN_SCORE..MAX_SCORE.
+
+    Built once from the reference frame, it answers percentile and quantile
+    questions in O(1) / O(log n) without touching the raw rows again.
+    """
+
+    def __init__(self, categories, counts):
+        self.labels = pd.Index(categories)
+        self.categories = self.labels.tolist()
+        self.counts = np.asarray(counts, dtype='int64')          # (n_dims, 101)
+        self.cumulative = np.cumsum(self.counts, axis=1)         # scores <= s
+        self.n = self.cumulative[:, -1]
+        self._positions = {category: j for j, category in enumerate(self.categories)}
+
+    @classmethod
+    def from_frame(cls, frame):
+        n_scores = MAX_SCORE - MIN_SCORE + 1
+        if all(np.issubdtype(dtype, np.integer) for dtype in frame.dtypes):
+            # No missing values possible: count each column in place (no float copy of the frame)
+            counts = [np.bincount(np.clip(frame[c].to_numpy(), MIN_SCORE, MAX_SCORE) - MIN_SCORE, minlength=n_scores)
+                      for c in frame.columns]
+            return cls(frame.columns, np.array(counts))
+        values = frame.to_numpy(dtype='float64')
+        valid = ~np.isnan(values)
+        scores = np.clip(np.rint(np.where(valid, values, MIN_SCORE)), MIN_SCORE, MAX_SCORE).astype('int64')
+        # One bincount over (dimension, score) pairs covers every column at once
+        flat = (np.arange(values.shape[1]) * n_scores + (scores - MIN_SCORE))[valid]
+        counts = np.bincount(flat, minlength=values.shape[1] * n_scores)
+        return cls(frame.columns, counts.reshape(values.shape[1], n_scores))
+
+    def _position(self, category):
+        return self._positions[category]
+
+    def percentile_rank(self, category, score):
+        """Percentage of the population scoring below `score`, counting ties as half (NaN if it is empty)."""
+        j = self._position(category)
+        if self.n[j] == 0:
+            # Nobody to compare with (e.g. a cohort replayed before any submissions)
+            return float('nan')
+        s = int(np.clip(round(score), MIN_SCORE, MAX_SCORE)) - MIN_SCORE
+        below = self.cumulative[j, s - 1] if s > 0 else 0
+        return 100.0 * (below + 0.5 * self.counts[j, s]) / self.n[j]
+
+    def quantile(self, q):
+        """Quantile of every dimension, interpolated the same way as DataFrame.quantile."""
+        pos = q * (self.n - 1)
+        lo = np.floor(pos).astype('int64')
+        hi = np.minimum(lo + 1, self.n - 1)
+        lo_value = np.array([np.searchsorted(c, k, side='right') for c, k in zip(self.cumulative, lo)])
+        hi_value = np.array([np.searchsorted(c, k, side='right') for c, k in zip(self.cumulative, hi)])
+        result = MIN_SCORE + lo_value + (hi_value - lo_value) * (pos - lo)
+        return pd.Series(result.astype('float64'), index=self.labels)
+
+    def histogram(self, width=HISTOGRAM_BIN_WIDTH):
+        """
+        Counts per bin [k * width, (k + 1) * width) for every dimension, with the
+        top score folded into the last bin. Returns (counts, edges).
+        """
+        n_bins = -(-(MAX_SCORE - MIN_SCORE) // width)
+        padded = np.zeros((len(self.categories), n_bins * width), dtype='int64')
+        padded[:, :MAX_SCORE - MIN_SCORE] = self.counts[:, :-1]
+        counts = padded.reshape(len(self.categories), n_bins, width).sum(axis=2)
+        counts[:, -1] += self.counts[:, -1]
+        return counts, MIN_SCORE + np.arange(n_bins + 1) * width
+
+
+def ordinal(n):
+    """1 -> '1st', 22 -> '22nd', 13 -> '13th'."""
+    suffix = 'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')
+    return f"{n}{suffix}"
+
+
+def percentile_label(percentile):
+    """ordinal() of a rounded percentile rank, or '–' if there is none (an empty population)."""
+    return '–' if np.isnan(percentile) else ordinal(round(percentile))
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """The reference population plus the statistics derived from it."""
+    path: str
+    sha256: str
+    frame: pd.DataFrame
+    avs: pd.Series
+    q1: pd.Series
+    q3: pd.Series
+    median: pd.Series
+    index: ScoreIndex
+    histogram_counts: np.ndarray
+    histogram_edges: np.ndarray
+    # Percentage of the population of each type (see type_distribution.py)
+    type_shares: pd.Series
+    # Bumped by RunningStats each time live submissions change the statistics
+    version: int = 0
+
+    @property
+    def categories(self):
+        return self.avs.index.tolist()
+
+    @property
+    def cache_key(self):
+        """Identifies this exact set of statistics, for caching anything derived from them."""
+        return (self.sha256, self.version)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the rows and statistics (memory-mapped rows included)."""
+        series = (self.avs, self.q1, self.q3, self.median, self.type_shares)
+        return int(self.frame.memory_usage(index=True).sum() + 2 * self.index.counts.nbytes
+                   + self.histogram_counts.nbytes + sum(s.memory_usage(index=True) for s in series))
+
+
+@dataclass
+class _Entry:
+    mtime_ns: int
+    size: int
+    data: ReferenceData
+
+
+_lock = threading.Lock()
+# Least recently used first
+_entries = OrderedDict()
+_stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'evictions': 0}
+# Paths being hashed or parsed right now, each with an event set when that is done
+_loading = {}
+# Called with the sha256 of every evicted reference, so derived caches can drop it too
+_eviction_listeners = []
+
+
+def on_evict(listener):
+    """Register `listener(sha256)` to be called when a reference file leaves the cache."""
+    _eviction_listeners.append(listener)
+    return listener
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_frame(path, sha256):
+    """Memory-map the binary copy of `path` if it is up to date, otherwise parse the CSV."""
+    # Imported here because binary_scores uses this module's helpers
+    from binary_scores import binary_path_for, read_binary
+
+    binary_path = binary_path_for(path)
+    if os.path.exists(binary_path):
+        try:
+            return read_binary(binary_path, expected_sha256=sha256)
+        except (ValueError, OSError) as e:
+            logger.warning("Ignoring %s: %s", binary_path, e)
+    return pd.read_csv(path)
+
+
+def _build(path, sha256):
+    d = _read_frame(path, sha256)
+    d = d.rename(columns=COLUMN_RENAMES)
+    index = ScoreIndex.from_frame(d)
+    histogram_counts, histogram_edges = index.histogram()
+    avs = d.mean()
+    return ReferenceData(
+        path=path,
+        sha256=sha256,
+        frame=d,
+        avs=avs,
+        q1=index.quantile(0.25),
+        q3=index.quantile(0.75),
+        median=index.quantile(0.5),
+        index=index,
+        histogram_counts=histogram_counts,
+        histogram_edges=histogram_edges,
+        type_shares=type_shares(d, avs),
+    )
+
+
+def load_reference(path='scores.csv'):
+    """
+    Return the cached ReferenceData for `path`, loading it on first use.
+
+    Each call costs a single stat(). The file is hashed only when its mtime or
+    size changes, and parsed only when the hash differs from the cached copy.
+    Hashing and parsing happen outside the cache lock, so loading one file never
+    holds up sessions using another; concurrent calls for the same file wait for
+    the one doing the work.
+    """
+    key = os.path.abspath(path)
+    while True:
+        st = os.stat(key)
+        with _lock:
+            entry = _entries.get(key)
+            if entry is not None:
+                _entries.move_to_end(key)
+            if entry is not None and (entry.mtime_ns, entry.size) == (st.st_mtime_ns, st.st_size):
+                _stats['hits'] += 1
+                return entry.data
+            loading = _loading.get(key)
+            if loading is None:
+                loading = _loading[key] = threading.Event()
+                break
+        # Another thread is (re)loading this file: wait for it, then look again
+        loading.wait()
+
+    try:
+        sha256 = file_sha256(key)
+        if entry is not None and entry.data.sha256 == sha256:
+            # Touched but unchanged: keep the parsed data
+            data, reloaded = entry.data, False
+        else:
+            data, reloaded = _build(path, sha256), entry is not None
+        with _lock:
+            if reloaded or entry is None:
+                _stats['misses'] += 1
+                if reloaded:
+                    _stats['reloads'] += 1
+                logger.info("Loaded reference data from %s (%d rows, sha256 %s)", path, len(data.frame), sha256[:12])
+            else:
+                _stats['hits'] += 1
+            # Re-added in case it was evicted while we were working
+            _entries[key] = _Entry(st.st_mtime_ns, st.st_size, data)
+            _entries.move_to_end(key)
+            # A reloaded file's previous version is gone too, unless another path has the same content
+            evicted = ([entry.data.sha256] if reloaded else []) + _evict_over_budget()
+            cached = {e.data.sha256 for e in _entries.values()}
+            evicted = [sha256 for sha256 in evicted if sha256 not in cached]
+    finally:
+        with _lock:
+            del _loading[key]
+        loading.set()
+    # Outside the lock: listeners take their own locks
+    for sha256 in evicted:
+        for listener in _eviction_listeners:
+            listener(sha256)
+    return data
+
+
+def _evict_over_budget():
+    """Drop least recently used entries until the rest fit the budget (always keeping the newest)."""
+    evicted = []
+    total = sum(entry.data.nbytes for entry in _entries.values())
+    while total > MEMORY_BUDGET and len(_entries) > 1:
+        path, entry = _entries.popitem(last=False)
+        total -= entry.data.nbytes
+        _stats['evictions'] += 1
+        evicted.append(entry.data.sha256)
+        logger.info("Evicted reference data for %s (%d bytes) to stay within the %d MB budget",
+                    path, entry.data.nbytes, MEMORY_BUDGET // 2 ** 20)
+    return evicted
+
+
+def cache_stats():
+    """Hit/miss counters for the reference cache (a copy, safe to display)."""
+    with _lock:
+        return dict(_stats, entries=len(_entries), bytes=sum(entry.data.nbytes for entry in _entries.values()))
+
+
+def clear_cache():
+    """Drop all cached reference data and reset the counters."""
+    with _lock:
+        _entries.clear()
+        for name in _stats:
+            _stats[name] = 0
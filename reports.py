@@ -0,0 +1,249 @@
+"""
+Bulk result reports, without the app.
+
+Reads a CSV of raw responses (as accepted by scoring.py), scores it with the
+app's scoring engine and writes, for every respondent, what the results pages
+would have shown them: their type and its description, the radar chart and the
+histogram panel, against one cohort's reference data (see cohorts.py).
+
+    python reports.py responses.csv -o reports/ --id-column respondent_id
+    python reports.py responses.csv -o reports/ --cohort wave2 --format json --workers 8
+
+For each respondent <id> the output directory gets <id>.json (scores,
+percentiles, type) and/or <id>.html (the same plus both figures). The HTML
+pages share one copy of plotly.js, written next to them. summary.csv lists
+every respondent's scores, type and report file, and summary.json the totals.
+Ids that would share a file name (a repeated id, or 'a/b' and 'a_b', which both
+become a_b) keep every report: the later ones get the input row number added,
+as in a_b-row41.
+
+The input is read in chunks of --chunksize rows. Each chunk is scored in one
+vectorized pass, then its reports are rendered across a pool of worker
+processes before the next chunk is read, so memory stays bounded however many
+respondents there are. Each worker loads the reference data and builds the
+population part of each figure once, then reuses it for every report.
+"""
+import argparse
+import html
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import pandas as pd
+
+from cohorts import get_registry
+from figures import RADAR_MODES, build_details_figure, build_radar_figure
+from reference_data import COLUMN_RENAMES, percentile_label
+from scoring import engine
+from type_distribution import primary_types
+
+FORMATS = ('html', 'json')
+PLOTLY_JS = 'plotly.min.js'
+# Density mode keeps each report's radar chart the same size however large the cohort is
+DEFAULT_RADAR_MODE = 'density'
+
+_HTML_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Wild Values results: {report_id}</title>
+<script src="{plotly_js}"></script>
+</head>
+<body style="font-family: sans-serif; max-width: 1200px; margin: auto;">
+<h1>Your Wild Values personality type is:</h1>
+<div style="text-align: center; font-size: 16px;">{description}</div>
+<h2>Your Wild Values Scores</h2>
+{radar}
+{table}
+<h2>Results in Detail</h2>
+{details}
+</body>
+</html>
+"""
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def _safe_name(report_id):
+    """A file name for a respondent id (anything but letters, digits, '-', '_' and '.' becomes '_')."""
+    return re.sub(r'[^\w.-]', '_', str(report_id))
+
+
+def _rounded(value, digits):
+    """`value` rounded for a JSON report, or None if it is NaN (an empty cohort has no averages or ranks)."""
+    value = float(value)
+    return None if math.isnan(value) else round(value, digits)
+
+
+def _report_names(ids, rows, used):
+    """
+    File names (without extension) for a chunk of ids and their input row numbers,
+    unique across the run. `used` holds the names taken so far, case-folded for
+    case-insensitive file systems, and is updated.
+    """
+    names = []
+    for report_id, row in zip(ids, rows):
+        name = _safe_name(report_id)
+        if name.casefold() in used:
+            name = f'{name}-row{row}'
+            if name.casefold() in used:
+                raise ValueError(f"Cannot find a unique file name for id {report_id!r} (row {row})")
+        used.add(name.casefold())
+        names.append(name)
+    return names
+
+
+def _init_worker(cohort_name, output_dir, formats, radar_mode):
+    from content import type_descriptions
+
+    cohort = get_registry()[cohort_name]
+    reference = cohort.reference()
+    _worker.update(cohort=cohort, reference=reference, output_dir=output_dir, formats=formats,
+                   radar_mode=radar_mode, descriptions=type_descriptions(reference, cohort.members))
+
+
+def _render_report(task):
+    """Write one respondent's report(s). Runs in a worker process."""
+    report_id, name, scores, type_position = task
+    cohort, reference = _worker['cohort'], _worker['reference']
+    categories = reference.categories
+    user_scores = dict(zip(categories, scores))
+    user_type = categories[type_position]
+    percentiles = [reference.index.percentile_rank(c, user_scores[c]) for c in categories]
+
+    path = os.path.join(_worker['output_dir'], name)
+    if 'json' in _worker['formats']:
+        report = {
+            'id': report_id,
+            'cohort': cohort.name,
+            'type': user_type,
+            'type_share': _rounded(reference.type_shares[user_type], 2),
+            'scores': {c: {'score': int(user_scores[c]), 'average': _rounded(reference.avs[c], 2),
+                           'percentile': _rounded(p, 1)}
+                       for c, p in zip(categories, percentiles)},
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if 'html' in _worker['formats']:
+        radar = build_radar_figure(reference, user_scores, _worker['radar_mode'], cohort.member)
+        details = build_details_figure(reference, user_scores)
+        table = pd.DataFrame({
+            'Your score': [user_scores[c] for c in categories],
+            'Average score': reference.avs.round(1).values,
+            'Percentile': [percentile_label(p) for p in percentiles],
+        }, index=categories).to_html()
+        page = _HTML_PAGE.format(
+            report_id=html.escape(str(report_id)), plotly_js=PLOTLY_JS, description=_worker['descriptions'][user_type], table=table,
+            radar=radar.to_html(full_html=False, include_plotlyjs=False),
+            details=details.to_html(full_html=False, include_plotlyjs=False))
+        with open(path + '.html', 'w', encoding='utf-8') as f:
+            f.write(page)
+    return report_id
+
+
+def generate_reports(input_path, output_dir, cohort_name=None, id_column=None, formats=FORMATS,
+                     radar_mode=DEFAULT_RADAR_MODE, chunksize=5_000, workers=None):
+    """
+    Write a report per respondent in `input_path` to `output_dir`, plus summary.csv
+    and summary.json. Returns the summary dict.
+    """
+    if radar_mode not in RADAR_MODES:
+        raise ValueError(f"Unknown radar mode {radar_mode!r}, expected one of {RADAR_MODES}")
+    registry = get_registry()
+    if cohort_name is None:
+        cohort = registry.default
+    elif cohort_name in registry.names:
+        cohort = registry[cohort_name]
+    else:
+        raise ValueError(f"Unknown cohort {cohort_name!r}, expected one of {registry.names}")
+    reference = cohort.reference()
+    categories = reference.categories
+    averages = reference.avs.to_numpy()
+    workers = workers or os.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+    if 'html' in formats:
+        from plotly.offline import get_plotlyjs
+
+        with open(os.path.join(output_dir, PLOTLY_JS), 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+
+    summary_path = os.path.join(output_dir, 'summary.csv')
+    score_columns = {category: name for name, category in COLUMN_RENAMES.items()}
+    type_counts = Counter()
+    n_rows = renamed = 0
+    used_names = set()
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(cohort.name, output_dir, tuple(formats), radar_mode)) as pool:
+        for i, chunk in enumerate(pd.read_csv(input_path, chunksize=chunksize)):
+            ids = chunk[id_column] if id_column else pd.Series(chunk.index, index=chunk.index)
+            scored = engine.score_frame(chunk.drop(columns=[id_column] if id_column else []))
+            scores = scored[categories].to_numpy()
+            types = primary_types(scores, averages)
+            names = _report_names(ids.tolist(), chunk.index.tolist(), used_names)
+            renamed += sum(name != _safe_name(report_id) for name, report_id in zip(names, ids.tolist()))
+
+            tasks = zip(ids.tolist(), names, scores.tolist(), types.tolist())
+            # Finish this chunk before reading the next, so only one chunk is ever in flight
+            for _ in pool.imap_unordered(_render_report, tasks, chunksize=max(1, len(chunk) // (4 * workers))):
+                pass
+
+            rows = pd.concat([ids.rename('id'), scored.rename(columns=score_columns)], axis=1)
+            rows['type'] = [categories[t] for t in types]
+            rows['file'] = names
+            rows.to_csv(summary_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            type_counts.update(rows['type'])
+            n_rows += len(rows)
+            print(f"{n_rows} reports written ({n_rows / (time.perf_counter() - start):.0f}/s)", file=sys.stderr)
+
+    summary = {
+        'input': input_path,
+        'cohort': cohort.name,
+        'respondents': n_rows,
+        'renamed': renamed,
+        'formats': list(formats),
+        'radar_mode': radar_mode,
+        'seconds': round(time.perf_counter() - start, 2),
+        'types': {category: type_counts[category] for category in categories},
+        'type_shares': {category: round(100.0 * type_counts[category] / max(n_rows, 1), 2)
+                        for category in categories},
+    }
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    if renamed:
+        print(f"{renamed} respondents shared a file name with an earlier one; their reports have the "
+              f"row number added (see the file column of summary.csv)", file=sys.stderr)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write Wild Values result reports for a file of raw responses.")
+    parser.add_argument('input', help="CSV of raw responses (0-4 per item, before reverse coding)")
+    parser.add_argument('-o', '--output', required=True, help="Directory to write the reports to")
+    parser.add_argument('--id-column', help="Input column identifying each respondent (default: row number)")
+    parser.add_argument('--cohort', help="Cohort to compare against (default: the first in WILD_VALUES_COHORTS)")
+    parser.add_argument('--format', choices=FORMATS, action='append',
+                        help="Report format (repeatable; default: html and json)")
+    parser.add_argument('--radar-mode', choices=RADAR_MODES, default=DEFAULT_RADAR_MODE,
+                        help=f"Radar chart background (default: {DEFAULT_RADAR_MODE})")
+    parser.add_argument('--chunksize', type=int, default=5_000, help="Respondents read per chunk (default: 5000)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+    names = get_registry().names
+    if args.cohort is not None and args.cohort not in names:
+        parser.error(f"unknown cohort {args.cohort!r} (choose from {', '.join(names)})")
+
+    summary = generate_reports(args.input, args.output, args.cohort, args.id_column, args.format or FORMATS,
+                               args.radar_mode, args.chunksize, args.workers)
+    print(f"Wrote {summary['respondents']} reports to {args.output} in {summary['seconds']} s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
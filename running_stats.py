@@ -0,0 +1,115 @@
+"""
+Reference statistics that keep up with live submissions.
+
+Scores are whole numbers from 0 to 100, so the whole distribution of each
+dimension is a 101-bin count vector. Folding in a new response is six counter
+increments, and every statistic the results pages use (mean, exact quantiles,
+percentile ranks, histograms) can be rebuilt from the counts in constant time,
+however many responses there are.
+
+Each update publishes a new immutable ReferenceData snapshot. Readers just take
+the current snapshot, so the results pages never wait on a lock.
+"""
+import dataclasses
+import itertools
+import threading
+
+import numpy as np
+import pandas as pd
+
+from reference_data import MAX_SCORE, MIN_SCORE, ScoreIndex, on_evict
+
+# Snapshot versions come from one process-wide counter, so two RunningStats over the
+# same reference file (two live cohorts) never publish snapshots with the same cache_key
+_versions = itertools.count(1)
+
+
+class RunningStats:
+    """Incrementally updated statistics, seeded from a reference population."""
+
+    def __init__(self, reference):
+        self._reference = reference
+        self._counts = reference.index.counts.copy()
+        scores = np.arange(MIN_SCORE, MAX_SCORE + 1)
+        self._sums = self._counts @ scores
+        self._lock = threading.Lock()
+        # The seed snapshot is the reference itself, so nothing changes until a response arrives
+        self._snapshot = reference
+
+    @property
+    def categories(self):
+        return self._reference.categories
+
+    def add(self, scores):
+        """Fold in one response (a dict of category -> normalized score)."""
+        self.add_many([[scores[c] for c in self.categories]])
+
+    def add_many(self, rows):
+        """Fold in an N x n_dims array of normalized scores and publish once."""
+        rows = np.clip(np.asarray(rows, dtype='int64'), MIN_SCORE, MAX_SCORE)
+        if rows.size == 0:
+            return
+        with self._lock:
+            for j in range(rows.shape[1]):
+                self._counts[j] += np.bincount(rows[:, j] - MIN_SCORE, minlength=self._counts.shape[1])
+            self._sums += rows.sum(axis=0)
+            self._publish()
+
+    def _publish(self):
+        # Everything here is O(n_dims * 101), independent of the population size
+        counts = self._counts.copy()
+        index = ScoreIndex(self._reference.index.labels, counts)
+        histogram_counts, histogram_edges = index.histogram()
+        self._snapshot = dataclasses.replace(
+            self._reference,
+            avs=pd.Series(self._sums / index.n, index=index.labels),
+            q1=index.quantile(0.25),
+            q3=index.quantile(0.75),
+            median=index.quantile(0.5),
+            index=index,
+            histogram_counts=histogram_counts,
+            histogram_edges=histogram_edges,
+            version=next(_versions),
+        )
+
+    def snapshot(self):
+        """
+        The latest consistent statistics, as a ReferenceData.
+
+        Only the aggregates are live: `frame` (and so the radar chart background)
+        and `type_shares` still describe the reference population the stats were
+        seeded from. Type membership is relative to the averages, so every row
+        would have to be reassessed whenever they moved.
+        """
+        return self._snapshot
+
+
+_running = {}
+_running_lock = threading.Lock()
+
+
+def get_running_stats(reference, seed_rows=None, cohort=None):
+    """
+    The process-wide RunningStats for a cohort's reference population.
+
+    `seed_rows` is called once, when the stats are first created, and should
+    return the scores of the cohort's responses collected so far (e.g. from the
+    submission store). Cohorts sharing a reference file each get their own stats.
+    """
+    key = (reference.cache_key, cohort)
+    with _running_lock:
+        stats = _running.get(key)
+        if stats is None:
+            stats = RunningStats(reference)
+            if seed_rows is not None:
+                stats.add_many(seed_rows())
+            _running[key] = stats
+        return stats
+
+
+@on_evict
+def _forget_reference(sha256):
+    # Each RunningStats holds its seed reference, frame and all, alive
+    with _running_lock:
+        for key in [key for key in _running if key[0][0] == sha256]:
+            del _running[key]
@@ -0,0 +1,137 @@
+"""
+Vectorized scoring for the Wild Values test.
+
+Turns raw slider positions (0-4, before reverse coding) into the normalized
+0-100 sub-scale scores shown on the results pages. The questionnaire is compiled
+once into weight and offset arrays, so scoring any number of respondents is a
+single NumPy pass.
+
+Run as a script to re-score archived responses offline:
+
+    python scoring.py responses.csv -o scored.csv
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from questionnaire import questions, reverse_coding_map, slider_values
+from reference_data import COLUMN_RENAMES
+
+MAX_RESPONSE = max(slider_values)
+
+
+def item_key(category, idx):
+    """Name of a questionnaire item, as used for the slider keys and batch columns."""
+    return f"{category}_{idx}"
+
+
+class ScoringEngine:
+    """Precomputed scoring arrays for a questionnaire."""
+
+    def __init__(self, questions, reverse_coding_map):
+        self.categories = list(questions)
+        self.item_keys = [item_key(category, idx)
+                          for category, items in questions.items() for idx in range(len(items))]
+        n_items, n_scales = len(self.item_keys), len(self.categories)
+
+        # Reverse-coded items score (MAX_RESPONSE - response), the rest score the response itself
+        self.weights = np.ones(n_items, dtype='int64')
+        self.offsets = np.zeros(n_items, dtype='int64')
+        # membership[i, j] is 1 when item i belongs to sub-scale j
+        self.membership = np.zeros((n_items, n_scales), dtype='int64')
+        self.max_raw_scores = np.zeros(n_scales, dtype='int64')
+
+        i = 0
+        for j, (category, items) in enumerate(questions.items()):
+            reversed_items = set(reverse_coding_map.get(category, []))
+            for idx in range(len(items)):
+                if idx in reversed_items:
+                    self.weights[i], self.offsets[i] = -1, MAX_RESPONSE
+                self.membership[i, j] = 1
+                i += 1
+            self.max_raw_scores[j] = len(items) * MAX_RESPONSE
+
+    def score_matrix(self, responses):
+        """
+        Score an N x n_items matrix of raw responses.
+
+        Returns an N x n_scales integer array of normalized scores (0-100).
+        """
+        responses = np.asarray(responses, dtype='int64')
+        if responses.ndim != 2 or responses.shape[1] != len(self.item_keys):
+            raise ValueError(f"Expected an N x {len(self.item_keys)} response matrix, got shape {responses.shape}")
+        if responses.size and (responses.min() < 0 or responses.max() > MAX_RESPONSE):
+            raise ValueError(f"Responses must be between 0 and {MAX_RESPONSE}")
+        raw_scores = (self.offsets + self.weights * responses) @ self.membership
+        # Same float arithmetic and truncation as int((raw / max) * 100)
+        return np.trunc(raw_scores / self.max_raw_scores * 100).astype('int64')
+
+    def score(self, responses):
+        """
+        Score one respondent.
+
+        `responses` maps each category to its list of raw responses, as kept in
+        st.session_state.responses. Returns a dict of category -> normalized score.
+        """
+        row = [value for category in self.categories for value in responses[category]]
+        return dict(zip(self.categories, self.score_matrix([row])[0].tolist()))
+
+    def score_frame(self, frame):
+        """
+        Score a DataFrame of raw responses.
+
+        Item columns are matched by name (e.g. '1. Valuation_0') when present.
+        Otherwise the frame must have exactly n_items columns, taken in
+        questionnaire order; anything else (such as an unnamed id column, which
+        would shift every item) raises ValueError.
+        Returns a DataFrame with one column per category, on the same index.
+        """
+        if set(self.item_keys) <= set(frame.columns):
+            items = frame[self.item_keys]
+        elif len(frame.columns) == len(self.item_keys):
+            items = frame
+        else:
+            raise ValueError(f"Expected the {len(self.item_keys)} item columns {self.item_keys[0]!r} ... "
+                             f"{self.item_keys[-1]!r}, or exactly {len(self.item_keys)} columns in "
+                             f"questionnaire order; got {len(frame.columns)} columns")
+        scores = self.score_matrix(items.to_numpy())
+        return pd.DataFrame(scores, columns=self.categories, index=frame.index)
+
+
+engine = ScoringEngine(questions, reverse_coding_map)
+
+
+def score_file(input_path, output_path, chunksize=100_000, id_columns=()):
+    """
+    Re-score a CSV of raw responses chunk by chunk.
+
+    The output uses the scores.csv column names, preceded by any `id_columns`
+    copied through from the input. Returns the number of rows scored.
+    """
+    out_columns = {category: name for name, category in COLUMN_RENAMES.items()}
+    n_rows = 0
+    for i, chunk in enumerate(pd.read_csv(input_path, chunksize=chunksize)):
+        scored = engine.score_frame(chunk.drop(columns=list(id_columns)))
+        scored = pd.concat([chunk[list(id_columns)], scored.rename(columns=out_columns)], axis=1)
+        scored.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+        n_rows += len(scored)
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score archived Wild Values responses.")
+    parser.add_argument('input', help="CSV of raw responses (0-4 per item, before reverse coding)")
+    parser.add_argument('-o', '--output', required=True, help="CSV to write normalized scores to")
+    parser.add_argument('--id-column', action='append', default=[],
+                        help="Input column to copy through to the output (repeatable)")
+    parser.add_argument('--chunksize', type=int, default=100_000, help="Rows per chunk (default: 100000)")
+    args = parser.parse_args(argv)
+
+    n_rows = score_file(args.input, args.output, args.chunksize, args.id_column)
+    print(f"Scored {n_rows} responses -> {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+Durable store for completed Wild Values tests.
+
+The app hands each finished test to SubmissionStore.submit(), which only puts it
+on an in-memory queue. A background thread drains the queue and writes batches
+to SQLite in WAL mode, so the Streamlit script never waits on disk and many
+sessions (and server processes) can write to the same file at once.
+
+Rebuild a reference dataset from everything collected so far with:
+
+    python submissions.py replay submissions.db -o scores_live.csv [--base scores.csv] [--cohort public]
+"""
+import argparse
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from reference_data import COLUMN_RENAMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = 'submissions.db'
+
+# One score column per sub-scale, named as in scores.csv
+SCORE_COLUMNS = list(COLUMN_RENAMES)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    submitted_at REAL NOT NULL,
+    session_id TEXT,
+    items TEXT NOT NULL,
+    {scores},
+    cohort TEXT
+)
+""".format(scores=',\n    '.join(f'"{name}" INTEGER NOT NULL' for name in SCORE_COLUMNS))
+
+_INSERT = 'INSERT INTO submissions (submitted_at, session_id, items, {}, cohort) VALUES (?, ?, ?, {}, ?)'.format(
+    ', '.join(f'"{name}"' for name in SCORE_COLUMNS), ', '.join('?' * len(SCORE_COLUMNS)))
+
+
+def _has_cohort_column(conn):
+    return 'cohort' in {row[1] for row in conn.execute('PRAGMA table_info(submissions)')}
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(_SCHEMA)
+    # Stores created before the cohort was recorded; their tests keep a NULL cohort
+    if not _has_cohort_column(conn):
+        conn.execute('ALTER TABLE submissions ADD COLUMN cohort TEXT')
+    conn.commit()
+    return conn
+
+
+class SubmissionStore:
+    """Buffers submissions in memory and writes them to SQLite in batches."""
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=200, flush_interval=1.0, max_pending=100_000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'dropped': 0, 'batches': 0, 'errors': 0}
+        # Open (and create) the database up front so configuration errors surface here
+        self._conn = connect(path)
+        self._writer = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+        self._writer.start()
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def submit(self, items, scores, session_id=None, cohort=None):
+        """
+        Queue one completed test without blocking.
+
+        `items` is the flat list of raw responses (0-4) in questionnaire order,
+        `scores` the six normalized scores in the same order as SCORE_COLUMNS and
+        `cohort` the name of the cohort the user was compared with (see cohorts.py).
+        Returns False if the store is closed or the buffer is full.
+        """
+        row = (time.time(), session_id, ''.join(str(int(v)) for v in items), *(int(s) for s in scores), cohort)
+        if self._closed.is_set():
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning("Submission buffer full, dropping a submission")
+            return False
+        self._count('submitted')
+        return True
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Take whatever else is already waiting, up to one batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                # Keep the writer alive: if it died, flush() would never return
+                self._count('errors', len(batch))
+                logger.exception("Writing %d submissions to %s failed", len(batch), self.path)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        for attempt in range(5):
+            try:
+                with self._conn:
+                    self._conn.executemany(_INSERT, batch)
+                self._count('written', len(batch))
+                self._count('batches')
+                return
+            except sqlite3.OperationalError as e:
+                # Another process holds the write lock for longer than the busy timeout
+                logger.warning("Writing %d submissions failed (%s), retrying", len(batch), e)
+                time.sleep(0.1 * 2 ** attempt)
+            except sqlite3.Error as e:
+                # e.g. a corrupt database file, which retrying will not fix
+                logger.error("Writing %d submissions to %s failed: %s", len(batch), self.path, e)
+                break
+        self._count('errors', len(batch))
+        logger.error("Gave up writing %d submissions to %s", len(batch), self.path)
+
+    def flush(self):
+        """Block until everything submitted so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        self._closed.set()
+        self._writer.join()
+        self._conn.close()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, pending=self._queue.qsize())
+
+
+_store = None
+# Set once the store could not be opened; it is not retried on every submission
+_store_failed = False
+_store_lock = threading.Lock()
+# Submissions that never reached the store's queue (see submit)
+_submit_errors = 0
+
+
+def get_store(path=DEFAULT_PATH):
+    """
+    The process-wide store, shared by every Streamlit session, or None if it
+    could not be opened (e.g. its directory does not exist).
+    """
+    global _store, _store_failed
+    with _store_lock:
+        if _store is None and not _store_failed:
+            try:
+                _store = SubmissionStore(path)
+            except (sqlite3.Error, OSError):
+                _store_failed = True
+                logger.exception("Cannot open the submission store %s, completed tests will not be saved", path)
+                return None
+            atexit.register(_store.close)
+        return _store
+
+
+def submit(path, items, scores, session_id=None, cohort=None):
+    """
+    SubmissionStore.submit() on the process-wide store, for the app: never raises,
+    so a broken store cannot keep a user from their results. Failures are logged
+    and counted in submit_stats(). Returns whether the submission was queued.
+    """
+    global _submit_errors
+    try:
+        store = get_store(path)
+        if store is not None and store.submit(items, scores, session_id=session_id, cohort=cohort):
+            return True
+    except Exception:
+        logger.exception("Queueing a submission for %s failed", path)
+    with _store_lock:
+        _submit_errors += 1
+    return False
+
+
+def submit_stats():
+    """The process-wide store's counters, plus submissions that never reached it."""
+    with _store_lock:
+        store, errors = _store, _submit_errors
+    if store is None:
+        stats = dict.fromkeys(('submitted', 'written', 'dropped', 'batches', 'errors', 'pending'), 0)
+    else:
+        stats = store.stats()
+    return dict(stats, unsaved=errors)
+
+
+def read_submissions(path, cohort=None):
+    """
+    Stored submissions as a DataFrame (one row per completed test): all of them,
+    or those made against `cohort`. Tests stored before the cohort was recorded
+    belong to no cohort.
+    """
+    with closing(sqlite3.connect(path)) as conn:
+        if cohort is None:
+            return pd.read_sql_query('SELECT * FROM submissions ORDER BY id', conn)
+        if not _has_cohort_column(conn):
+            # Not yet migrated by a SubmissionStore: no test has a cohort
+            return pd.read_sql_query('SELECT * FROM submissions WHERE 0', conn)
+        return pd.read_sql_query('SELECT * FROM submissions WHERE cohort = ? ORDER BY id', conn, params=(cohort,))
+
+
+def read_scores(path, cohort=None):
+    """
+    Normalized scores of the stored submissions, optionally only those made
+    against `cohort` (empty if there is no store yet).
+    """
+    if not path or not os.path.exists(path):
+        return pd.DataFrame(columns=SCORE_COLUMNS, dtype='int64')
+    return read_submissions(path, cohort)[SCORE_COLUMNS]
+
+
+def replay(path, output_path, base_path=None, cohort=None):
+    """
+    Rebuild a reference dataset (scores.csv layout) from the stored submissions,
+    or only those made against `cohort`, optionally appended to an existing
+    reference file. Returns the row count.
+    """
+    scores = read_scores(path, cohort)
+    if base_path is not None:
+        scores = pd.concat([pd.read_csv(base_path)[SCORE_COLUMNS], scores], ignore_index=True)
+    scores.to_csv(output_path, index=False)
+    return len(scores)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tools for the Wild Values submission store.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help="Rebuild a reference CSV from stored submissions")
+    replay_parser.add_argument('database', help="SQLite submission store")
+    replay_parser.add_argument('-o', '--output', required=True, help="CSV to write (scores.csv layout)")
+    replay_parser.add_argument('--base', help="Existing reference CSV to prepend, e.g. scores.csv")
+    replay_parser.add_argument('--cohort', help="Only replay tests made against this cohort (default: all)")
+    args = parser.parse_args(argv)
+
+    n_rows = replay(args.database, args.output, args.base, args.cohort)
+    print(f"Wrote {n_rows} rows -> {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+The fast paths against the straightforward code they replaced.
+
+Run with `python -m pytest -q` from the repository root.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from binary_scores import binary_path_for, read_binary, write_binary
+from neighbours import BRUTE_FORCE_LIMIT, NeighbourIndex
+from questionnaire import questions, reverse_coding_map
+from reference_data import COLUMN_RENAMES, ScoreIndex, load_reference
+from scoring import MAX_RESPONSE, engine
+
+CATEGORIES = list(COLUMN_RENAMES.values())
+
+
+def _population(n, seed=0):
+    """Integer score vectors clustered like real responses, so radius queries find neighbours."""
+    rng = np.random.default_rng(seed)
+    return np.clip(np.rint(rng.normal(55, 15, (n, 6))), 0, 100).astype('int64')
+
+
+def _distances(points, query):
+    return np.sqrt(((np.asarray(points) - np.asarray(query)) ** 2).sum(axis=1))
+
+
+# Below and above BRUTE_FORCE_LIMIT: a direct scan, then the grid
+@pytest.fixture(scope='module', params=[2_000, BRUTE_FORCE_LIMIT + 5_000])
+def population(request):
+    points = _population(request.param)
+    index = NeighbourIndex(points)
+    # Held as pending inserts, not yet merged into the grid
+    extra = _population(200, seed=1)
+    for point in extra:
+        index.insert(point)
+    return index, np.concatenate([points, extra])
+
+
+@pytest.mark.parametrize('radius', [0, 5, 12, 20])
+def test_within_matches_brute_force(population, radius):
+    index, points = population
+    for query in _population(20, seed=2):
+        assert index.within(query, radius) == np.count_nonzero(_distances(points, query) <= radius)
+
+
+def test_nearest_matches_brute_force(population):
+    index, points = population
+    for query in _population(20, seed=3):
+        rows, distances = index.nearest(query, k=5)
+        np.testing.assert_allclose(distances, np.sort(_distances(points, query))[:5])
+        np.testing.assert_allclose(_distances(index.points(rows), query), distances)
+
+
+def test_own_row_is_excluded(population):
+    index, points = population
+    # The last pending insert, queried with its own scores
+    row = len(points) - 1
+    query = points[row]
+    others = np.delete(_distances(points, query), row)
+    assert index.within(query, 12, exclude=row) == np.count_nonzero(others <= 12)
+    rows, distances = index.nearest(query, k=5, exclude=row)
+    assert row not in rows
+    np.testing.assert_allclose(distances, np.sort(others)[:5])
+
+
+def test_inserts_merged_into_the_grid():
+    points = _population(BRUTE_FORCE_LIMIT + 1_000)
+    index = NeighbourIndex(points)
+    extra = _population(3_000, seed=4)
+    for point in extra:
+        index.insert(point)
+    assert index._n_indexed > len(points)
+    points = np.concatenate([points, extra])
+    for query in _population(10, seed=5):
+        assert index.within(query, 12) == np.count_nonzero(_distances(points, query) <= 12)
+
+
+@pytest.mark.parametrize('with_missing', [False, True])
+def test_score_index_quantiles_match_pandas(with_missing):
+    frame = pd.DataFrame(_population(5_001), columns=CATEGORIES)
+    if with_missing:
+        frame = frame.astype('float64')
+        frame.iloc[::7, 2] = np.nan
+    index = ScoreIndex.from_frame(frame)
+    for q in (0, 0.1, 0.25, 0.5, 0.75, 0.9, 1):
+        pd.testing.assert_series_equal(index.quantile(q), frame.quantile(q), check_names=False)
+
+
+def test_percentile_rank_counts_ties_as_half():
+    frame = pd.DataFrame(_population(1_000), columns=CATEGORIES)
+    index = ScoreIndex.from_frame(frame)
+    for category in CATEGORIES[:2]:
+        values = frame[category].to_numpy()
+        for score in (0, 40, 55, 70, 100):
+            expected = 100.0 * (np.count_nonzero(values < score) + 0.5 * np.count_nonzero(values == score)) / 1_000
+            assert index.percentile_rank(category, score) == pytest.approx(expected)
+
+
+def _score_by_loop(responses):
+    """The original per-question scoring from the app script."""
+    scores = {}
+    for category, items in questions.items():
+        raw_score = sum(MAX_RESPONSE - response if idx in reverse_coding_map[category] else response
+                        for idx, response in enumerate(responses[category]))
+        scores[category] = int(raw_score / (len(items) * MAX_RESPONSE) * 100)
+    return scores
+
+
+def test_scoring_engine_matches_the_loop():
+    rng = np.random.default_rng(6)
+    respondents = [{category: rng.integers(0, MAX_RESPONSE + 1, len(items)).tolist()
+                    for category, items in questions.items()} for _ in range(500)]
+    # Every answer at either extreme, too
+    respondents += [{category: [value] * len(items) for category, items in questions.items()}
+                    for value in (0, MAX_RESPONSE)]
+    for responses in respondents:
+        assert engine.score(responses) == _score_by_loop(responses)
+
+    matrix = [[value for category in engine.categories for value in responses[category]]
+              for responses in respondents]
+    expected = [[_score_by_loop(responses)[c] for c in engine.categories] for responses in respondents]
+    np.testing.assert_array_equal(engine.score_matrix(matrix), expected)
+
+
+def _write_scores(path, seed):
+    pd.DataFrame(_population(300, seed=seed), columns=list(COLUMN_RENAMES)).to_csv(path, index=False)
+    return pd.read_csv(path)
+
+
+def test_binary_round_trip(tmp_path):
+    path = str(tmp_path / 'scores.csv')
+    expected = _write_scores(path, seed=7)
+    write_binary(path)
+    frame = read_binary(binary_path_for(path))
+    assert list(frame.columns) == list(expected.columns)
+    np.testing.assert_array_equal(frame.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize('damage', ['stale', 'truncated'])
+def test_damaged_binary_falls_back_to_the_csv(tmp_path, damage):
+    path = str(tmp_path / 'scores.csv')
+    expected = _write_scores(path, seed=8)
+    write_binary(path)
+    if damage == 'stale':
+        # The CSV changed after the conversion
+        expected = _write_scores(path, seed=9)
+    else:
+        with open(binary_path_for(path), 'r+b') as f:
+            f.truncate(60)
+    frame = load_reference(path).frame
+    np.testing.assert_array_equal(frame.to_numpy(), expected.to_numpy())
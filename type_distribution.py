@@ -0,0 +1,99 @@
+"""
+How common each Wild Values type is.
+
+A respondent's type is the sub-scale where their score is furthest above the
+population average, the same rule the app's type page uses. Someone level on
+two or more sub-scales is joint-highest on each of them and counts towards
+every one, so the shares can add up to more than 100 percent. (The app itself
+shows only the first of a joint-highest set, in questionnaire order.)
+
+The counts are built a block of rows at a time, so memory stays flat however
+large the population is. For archives too big to load at all, stream the CSV:
+
+    python type_distribution.py scores.csv [--chunksize 500000]
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Rows per block; keeps the float64 difference matrix at a few megabytes
+BLOCK_ROWS = 65_536
+
+
+def joint_highest(scores, averages):
+    """
+    Boolean N x n_dims matrix: True where the row's difference from the average
+    is highest or joint-highest.
+    """
+    differences = np.asarray(scores, dtype='float64') - np.asarray(averages, dtype='float64')
+    return differences == differences.max(axis=1, keepdims=True)
+
+
+def primary_type(scores, averages):
+    """Position of the user's type: the first highest difference, as the type page picks it."""
+    differences = np.asarray(scores, dtype='float64') - np.asarray(averages, dtype='float64')
+    return int(np.argmax(differences))
+
+
+def primary_types(scores, averages):
+    """primary_type for every row of an N x n_dims matrix."""
+    differences = np.asarray(scores, dtype='float64') - np.asarray(averages, dtype='float64')
+    return np.argmax(differences, axis=1)
+
+
+def type_counts(scores, averages, block_rows=BLOCK_ROWS):
+    """Number of rows highest or joint-highest on each sub-scale, plus the row count."""
+    scores = np.asarray(scores)
+    counts = np.zeros(scores.shape[1], dtype='int64')
+    for start in range(0, len(scores), block_rows):
+        counts += joint_highest(scores[start:start + block_rows], averages).sum(axis=0)
+    return counts, len(scores)
+
+
+def type_shares(frame, averages=None):
+    """Percentage of `frame` belonging to each type, as a Series indexed like its columns."""
+    if averages is None:
+        averages = frame.mean()
+    counts, n = type_counts(frame.to_numpy(), np.asarray(averages))
+    return pd.Series(100.0 * counts / max(n, 1), index=frame.columns)
+
+
+def stream_type_shares(path, averages=None, chunksize=500_000):
+    """
+    type_shares for a CSV read in chunks of `chunksize` rows.
+
+    Without `averages` the file is read twice: once for the column means and
+    once to count the types.
+    """
+    if averages is None:
+        sums, n = 0, 0
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            sums = sums + chunk.sum()
+            n += len(chunk)
+        averages = sums / n
+    averages = pd.Series(averages)
+    counts, n = 0, 0
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk_counts, chunk_n = type_counts(chunk[averages.index].to_numpy(), averages.to_numpy())
+        counts = counts + chunk_counts
+        n += chunk_n
+    return pd.Series(100.0 * counts / max(n, 1), index=averages.index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share of respondents belonging to each Wild Values type.")
+    parser.add_argument('csv', help="Scores CSV, e.g. scores.csv")
+    parser.add_argument('--chunksize', type=int, default=500_000, help="Rows per chunk (default: 500000)")
+    args = parser.parse_args(argv)
+
+    shares = stream_type_shares(args.csv, chunksize=args.chunksize)
+    for category, share in shares.items():
+        print(f"{category}\t{share:.1f}%")
+    print(f"Joint-highest respondents count towards each of their types ({shares.sum():.1f}% in total)",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()